@@ -0,0 +1,2 @@
+# conftest.py
+# Lets pytest import the `src` package when run from workernode/ (python -m pytest -q)
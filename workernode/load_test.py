@@ -0,0 +1,357 @@
+# load_test.py
+"""
+End-to-end load generator for the scrape queue.
+
+Sends process_scrape_request jobs to the local Redis broker, follows every job to
+its final result and reports enqueue-to-result latency, throughput, retries and
+outcomes. By default it also serves a small local fixture site so no live mirror
+is touched.
+
+Examples:
+    python load_test.py --jobs 50 --rate 2                  # open loop, 2 jobs/s
+    python load_test.py --jobs 50 --concurrency 4           # closed loop, 4 in flight
+    python load_test.py --jobs 60 --mix duplicate           # mostly repeated titles
+    python load_test.py --jobs 60 --burst-size 20 --burst-interval 30
+
+Every fixture job targets the same host, so the per-domain rate limiter (RATE_LIMIT_*)
+would cap the run at its default rpm/concurrency. To measure the worker fleet rather
+than the limiter, lift the limit for the fixture host on the workers, e.g.
+    RATE_LIMIT_OVERRIDES='{"127.0.0.1": {"rpm": 100000, "burst": 1000, "concurrency": 1000}}'
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from src.celery_app import celery_app # Only the Celery app; the scraper stack is never imported
+from src.config import settings
+
+TASK_NAME = 'src.tasks.scrape_tasks.process_scrape_request'
+FINAL_STATES = ('SUCCESS', 'FAILURE', 'REVOKED')
+
+# Upper bound for the default --job-timeout (BROWSER_TIMEOUT may be configured very large)
+MAX_DEFAULT_JOB_TIMEOUT = 1800
+
+# Fraction of jobs that reuse an already-sent title for each mix preset
+MIX_DUPLICATE_RATIOS = {'unique': 0.0, 'mixed': 0.5, 'duplicate': 0.9}
+
+
+# --- Fixture site ---
+
+FIXTURE_PAGE = """<!DOCTYPE html>
+<html><head><title>Fixture {media_id}</title></head>
+<body>
+  <h1>Fixture title {media_id}</h1>
+  <iframe src="/embed/{media_id}.html" width="800" height="450"></iframe>
+</body></html>
+"""
+
+FIXTURE_EMBED = """<!DOCTYPE html>
+<html><head><title>Player {media_id}</title></head>
+<body>
+  <div id="player" class="video-js" style="width:780px;height:430px">
+    <video width="780" height="400"></video>
+    <button class="play-button" onclick="loadStream()">Play</button>
+  </div>
+  <script>
+    function loadStream() {{ fetch('/hls/{media_id}/master.m3u8'); }}
+    setTimeout(loadStream, 1500); // Autoplay path, in case nothing is clicked
+  </script>
+</body></html>
+"""
+
+FIXTURE_MANIFEST = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=1280000,RESOLUTION=1280x720
+/hls/{media_id}/720p.m3u8
+"""
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves /movie/<id>.html -> /embed/<id>.html -> /hls/<id>/master.m3u8."""
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        parts = path.strip('/').split('/')
+        if len(parts) == 2 and parts[0] == 'movie' and parts[1].endswith('.html'):
+            self._send(FIXTURE_PAGE.format(media_id=parts[1][:-5]), 'text/html')
+        elif len(parts) == 2 and parts[0] == 'embed' and parts[1].endswith('.html'):
+            self._send(FIXTURE_EMBED.format(media_id=parts[1][:-5]), 'text/html')
+        elif len(parts) == 3 and parts[0] == 'hls' and parts[2].endswith('.m3u8'):
+            self._send(FIXTURE_MANIFEST.format(media_id=parts[1]), 'application/vnd.apple.mpegurl')
+        else:
+            self.send_error(404)
+
+    def _send(self, body, content_type):
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass # Keep the report readable
+
+
+def start_fixture_server(host, port):
+    server = ThreadingHTTPServer((host, port), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[LoadTest] Fixture site serving on http://{host}:{server.server_port}/")
+    return server
+
+
+# --- Job generation ---
+
+def build_job_plan(total_jobs, duplicate_ratio, base_url, seed=None):
+    """Returns the list of job_data dicts to send, with the requested share of repeated titles."""
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:8]
+    seen = []
+    plan = []
+    for i in range(total_jobs):
+        if seen and rng.random() < duplicate_ratio:
+            media_id = rng.choice(seen)
+        else:
+            media_id = f"load_{run_id}_{i}"
+            seen.append(media_id)
+        plan.append({
+            'targetUrl': f"{base_url.rstrip('/')}/movie/{media_id}.html",
+            'mediaId': media_id,
+            'mediaType': 'movie',
+        })
+    return plan
+
+
+class TrackedJob:
+    def __init__(self, job_data):
+        self.job_data = job_data
+        self.result = None
+        self.enqueued_at = None
+        self.finished_at = None
+        self.state = 'PENDING'
+        self.outcome = None
+        self.retries = 0
+        self.saw_retry = False
+
+
+def _finish_time(async_result, observed_at):
+    """Prefers the backend's date_done over our polling time, which is only as precise as the poll interval."""
+    try:
+        date_done = async_result.date_done
+    except Exception:
+        date_done = None
+    if not date_done:
+        return observed_at
+    if date_done.tzinfo is None:
+        date_done = date_done.replace(tzinfo=timezone.utc)
+    return date_done.timestamp()
+
+
+def poll_job(job, now):
+    """Updates job from the result backend; returns True once the job is final."""
+    state = job.result.state
+    job.state = state
+    if state == 'RETRY':
+        job.saw_retry = True
+    if state not in FINAL_STATES:
+        return False
+
+    job.finished_at = _finish_time(job.result, now)
+    job.retries = job.result.retries or (1 if job.saw_retry else 0)
+    if state == 'SUCCESS':
+        payload = job.result.result or {}
+        job.outcome = payload.get('status', 'success') if isinstance(payload, dict) else 'success'
+    else:
+        job.outcome = state.lower()
+    job.result.forget() # Don't leave load-test results in Redis
+    return True
+
+
+def run_load(plan, rate=None, concurrency=None, burst_size=0, burst_interval=0.0,
+             job_timeout=300.0, poll_interval=0.25):
+    """
+    Sends the plan and follows every job to a final state.
+    - rate: open loop, jobs per second regardless of completions
+    - concurrency: closed loop, keep this many jobs in flight
+    - burst_size/burst_interval: send jobs in bursts of burst_size every burst_interval seconds
+    """
+    jobs = [TrackedJob(job_data) for job_data in plan]
+    pending = list(jobs)
+    in_flight = []
+    start = time.time()
+    next_send = start
+
+    def send(job):
+        job.enqueued_at = time.time()
+        job.result = celery_app.send_task(TASK_NAME, args=[job.job_data], queue=settings.SCRAPE_QUEUE_NAME)
+        in_flight.append(job)
+
+    while pending or in_flight:
+        now = time.time()
+
+        # --- Sending ---
+        if pending:
+            if burst_size:
+                if now >= next_send:
+                    for _ in range(min(burst_size, len(pending))):
+                        send(pending.pop(0))
+                    next_send = now + burst_interval
+            elif concurrency:
+                while pending and len(in_flight) < concurrency:
+                    send(pending.pop(0))
+            else:
+                interval = 1.0 / rate if rate else 0.0
+                while pending and now >= next_send:
+                    send(pending.pop(0))
+                    next_send += interval
+
+        # --- Following ---
+        now = time.time()
+        for job in list(in_flight):
+            if poll_job(job, now):
+                in_flight.remove(job)
+            elif now - job.enqueued_at > job_timeout:
+                job.outcome = 'timeout'
+                job.finished_at = now
+                in_flight.remove(job)
+
+        done = len(jobs) - len(pending) - len(in_flight)
+        print(f"\r[LoadTest] sent {len(jobs) - len(pending)}/{len(jobs)}  in flight {len(in_flight)}  done {done}", end='', flush=True)
+        time.sleep(poll_interval)
+
+    print()
+    return jobs, start
+
+
+# --- Reporting ---
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list: the ceil(pct/100 * n)-th value."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct * len(sorted_values) / 100.0))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(jobs, start):
+    """
+    Builds the report dict. Timed-out jobs stay in the latency percentiles at the time they
+    were given up on (a lower bound), so an overloaded fleet can't look faster than it is;
+    'latency_timeouts' says how many of the samples are such lower bounds.
+    """
+    completed = [j for j in jobs if j.outcome != 'timeout' and j.finished_at]
+    timed_out = [j for j in jobs if j.outcome == 'timeout' and j.finished_at]
+    latencies = sorted(j.finished_at - j.enqueued_at for j in completed + timed_out)
+    end = max((j.finished_at for j in jobs if j.finished_at), default=start)
+    elapsed = max(end - start, 1e-9)
+
+    outcomes = {}
+    for job in jobs:
+        outcomes[job.outcome] = outcomes.get(job.outcome, 0) + 1
+
+    return {
+        'jobs': len(jobs),
+        'unique_titles': len({j.job_data['mediaId'] for j in jobs}),
+        'elapsed_seconds': round(elapsed, 2),
+        'throughput_jobs_per_minute': round(len(completed) / elapsed * 60, 2),
+        'latency_seconds': {
+            name: (round(value, 2) if value is not None else None)
+            for name, value in (
+                ('min', latencies[0] if latencies else None),
+                ('p50', percentile(latencies, 50)),
+                ('p90', percentile(latencies, 90)),
+                ('p95', percentile(latencies, 95)),
+                ('p99', percentile(latencies, 99)),
+                ('max', latencies[-1] if latencies else None),
+            )
+        },
+        'latency_timeouts': len(timed_out),
+        'retries_total': sum(j.retries for j in jobs),
+        'jobs_retried': sum(1 for j in jobs if j.retries),
+        'outcomes': outcomes,
+    }
+
+
+def print_report(report):
+    print("--- Load Test Report ---")
+    print(f"Jobs: {report['jobs']} ({report['unique_titles']} unique titles)")
+    print(f"Elapsed (s): {report['elapsed_seconds']}")
+    print(f"Throughput (jobs/min): {report['throughput_jobs_per_minute']}")
+    latency = report['latency_seconds']
+    print("Enqueue-to-result latency (s): " + "  ".join(f"{k}={v}" for k, v in latency.items()) +
+          (f"  ({report['latency_timeouts']} timed-out jobs counted at their timeout)" if report['latency_timeouts'] else ""))
+    print(f"Retries: {report['retries_total']} across {report['jobs_retried']} jobs")
+    print("Outcomes: " + ", ".join(f"{k}={v}" for k, v in sorted(report['outcomes'].items())))
+    print("------------------------")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Queue load generator for process_scrape_request.")
+    parser.add_argument('--jobs', type=int, default=20, help="Total jobs to send")
+    pacing = parser.add_mutually_exclusive_group()
+    pacing.add_argument('--rate', type=float, help="Open loop: jobs per second")
+    pacing.add_argument('--concurrency', type=int, help="Closed loop: jobs kept in flight")
+    pacing.add_argument('--burst-size', type=int, default=0, help="Send jobs in bursts of this size")
+    parser.add_argument('--burst-interval', type=float, default=30.0, help="Seconds between bursts")
+    parser.add_argument('--mix', choices=sorted(MIX_DUPLICATE_RATIOS), default='unique',
+                        help="Share of repeated titles: unique=0%%, mixed=50%%, duplicate=90%%")
+    parser.add_argument('--duplicate-ratio', type=float, help="Override --mix with an explicit ratio (0-1)")
+    parser.add_argument('--target-base-url', help="Use an already running fixture site instead of the built-in one")
+    parser.add_argument('--fixture-host', default='127.0.0.1')
+    parser.add_argument('--fixture-port', type=int, default=8765)
+    parser.add_argument('--job-timeout', type=float,
+                        default=min(settings.SCRAPER_TIMEOUT_SECONDS * 4, MAX_DEFAULT_JOB_TIMEOUT),
+                        help="Give up following a job after this many seconds (covers retries)")
+    parser.add_argument('--poll-interval', type=float, default=0.25)
+    parser.add_argument('--seed', type=int, help="Seed for a repeatable duplicate pattern")
+    parser.add_argument('--json', dest='json_path', help="Also write the report to this file")
+    args = parser.parse_args()
+    if not args.rate and not args.concurrency and not args.burst_size:
+        args.concurrency = settings.WORKER_CONCURRENCY
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    duplicate_ratio = args.duplicate_ratio if args.duplicate_ratio is not None else MIX_DUPLICATE_RATIOS[args.mix]
+
+    server = None
+    base_url = args.target_base_url
+    if not base_url:
+        server = start_fixture_server(args.fixture_host, args.fixture_port)
+        base_url = f"http://{args.fixture_host}:{server.server_port}"
+
+    fixture_host = urlsplit(base_url).hostname
+    if settings.RATE_LIMIT_ENABLED and fixture_host not in settings.RATE_LIMIT_OVERRIDES:
+        print(f"[LoadTest] WARNING: rate limiting is on and '{fixture_host}' has no RATE_LIMIT_OVERRIDES entry; "
+              f"results will be capped at {settings.RATE_LIMIT_DEFAULT_RPM}/min and "
+              f"{settings.RATE_LIMIT_DEFAULT_CONCURRENCY} concurrent jobs (see the module docstring).")
+
+    plan = build_job_plan(args.jobs, duplicate_ratio, base_url, seed=args.seed)
+    print(f"[LoadTest] Sending {len(plan)} jobs to queue '{settings.SCRAPE_QUEUE_NAME}' (duplicate ratio {duplicate_ratio:.0%})")
+    try:
+        jobs, start = run_load(
+            plan,
+            rate=args.rate,
+            concurrency=args.concurrency,
+            burst_size=args.burst_size,
+            burst_interval=args.burst_interval,
+            job_timeout=args.job_timeout,
+            poll_interval=args.poll_interval,
+        )
+    finally:
+        if server:
+            server.shutdown()
+
+    report = summarize(jobs, start)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[LoadTest] Report written to {args.json_path}")
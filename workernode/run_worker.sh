@@ -12,11 +12,30 @@ echo "Starting Celery worker..."
 # Change to the worker directory before running celery
 cd "$DIR"
 
+# Read a single KEY from .env (value only, quotes and trailing comment stripped)
+env_file_value() {
+    [ -f "$DIR/.env" ] || return 0
+    grep -E "^$1=" "$DIR/.env" | tail -n 1 | cut -d= -f2- \
+        | sed -E 's/[[:space:]]+#.*$//; s/[[:space:]]+$//; s/^"(.*)"$/\1/; s/^'"'"'(.*)'"'"'$/\1/'
+}
+
+# Fill in only the flags used below, and only when the environment doesn't already set them
+# (same precedence as load_dotenv() in settings.py: process environment wins over .env)
+: "${WORKER_CONCURRENCY:=$(env_file_value WORKER_CONCURRENCY)}"
+: "${AUTOSCALE_ENABLED:=$(env_file_value AUTOSCALE_ENABLED)}"
+: "${AUTOSCALE_MIN_SLOTS:=$(env_file_value AUTOSCALE_MIN_SLOTS)}"
+: "${AUTOSCALE_MAX_SLOTS:=$(env_file_value AUTOSCALE_MAX_SLOTS)}"
+
 # Start celery worker
 # -A points to the celery app instance (src folder -> celery_app module -> celery_app variable)
 # -l sets the log level
 # -c sets the concurrency (number of worker processes) - read from env
-celery -A src.celery_app worker --loglevel=INFO -c ${WORKER_CONCURRENCY:-1}
+# --autoscale=MAX,MIN lets src/autoscaler.py grow/shrink browser slots from queue depth instead
+if [ "${AUTOSCALE_ENABLED:-false}" = "true" ]; then
+    celery -A src.celery_app worker --loglevel=INFO --autoscale=${AUTOSCALE_MAX_SLOTS:-4},${AUTOSCALE_MIN_SLOTS:-1}
+else
+    celery -A src.celery_app worker --loglevel=INFO -c ${WORKER_CONCURRENCY:-1}
+fi
 
 echo "Celery worker stopped."
 
@@ -1,8 +1,11 @@
 # send_test_job.py
-from src.tasks.scrape_tasks import process_scrape_request # Import the TASK
-from src.config import settings # To ensure env loaded if run directly
+from dotenv import load_dotenv
+from src.producer import enqueue_scrape # Lightweight producer - no celery/selenium import
+import os
 import uuid
 
+load_dotenv() # Pick up REDIS_URL / SCRAPE_QUEUE_NAME from .env if run directly
+
 # !!! REPLACE WITH A VALID URL FROM YOUR MIRROR SITE !!!
 test_url = "https://ww19.0123movie.net/movie/alien-romulus-1630857469.html"
 test_id = f"test_movie_{uuid.uuid4()}" # Unique ID for testing
@@ -13,14 +16,9 @@ if __name__ == "__main__":
         print("!!! Please replace 'test_url' in send_test_job.py with a real target URL !!!")
     else:
         print(f"Sending test job for URL: {test_url}")
-        job_data = {
-            'targetUrl': test_url,
-            'mediaId': test_id,
-            'mediaType': test_type
-        }
-        # Use .delay() to send the job to the queue
-        process_scrape_request.delay(job_data)
-        print(f"Job sent to queue '{settings.SCRAPE_QUEUE_NAME}' with ID {test_id}.")
+        # Validates the payload and pushes it straight onto the queue
+        task_id = enqueue_scrape(test_url, test_id, test_type)
+        print(f"Job sent to queue '{os.getenv('SCRAPE_QUEUE_NAME', 'media-scrape-jobs')}' with ID {test_id} (task {task_id}).")
         
 
-#? The send_test_job.py script's only job is to put a message onto the Redis queue. It does not configure the Celery worker process.
\ No newline at end of file
+#? The send_test_job.py script's only job is to put a message onto the Redis queue. It does not configure the Celery worker process.
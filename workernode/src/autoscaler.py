@@ -0,0 +1,182 @@
+# src/autoscaler.py
+import json
+import logging
+import time
+from time import monotonic
+
+import psutil
+import redis
+from celery.worker import state as worker_state
+from celery.worker.autoscale import Autoscaler
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Header stamped on every scrape job at publish time (see celery_app.py / producer.py)
+ENQUEUED_AT_HEADER = 'enqueued_at'
+
+
+def read_queue_stats(redis_client, queue_name):
+    """
+    Returns (depth, oldest_age_seconds) for a kombu Redis queue.
+    kombu LPUSHes new messages and BRPOPs from the right, so the oldest waiting
+    message is at index -1. Age is None if the message carries no enqueue stamp.
+    """
+    depth = redis_client.llen(queue_name)
+    if not depth:
+        return 0, 0.0
+    oldest_age = None
+    raw = redis_client.lindex(queue_name, -1)
+    if raw:
+        try:
+            enqueued_at = json.loads(raw).get('headers', {}).get(ENQUEUED_AT_HEADER)
+            if enqueued_at:
+                oldest_age = max(0.0, time.time() - float(enqueued_at))
+        except (ValueError, TypeError, AttributeError):
+            pass # Not a message we can parse, fall back to depth only
+    return depth, oldest_age
+
+
+def read_local_backlog(reserved, active, now=None):
+    """
+    Returns (count, oldest_age_seconds) for jobs this worker has prefetched but not started.
+    Under --autoscale Celery prefetches max_concurrency * worker_prefetch_multiplier messages,
+    so these jobs are gone from Redis but still waiting for a slot. Age is None if none of
+    them carries an enqueue stamp.
+    """
+    now = time.time() if now is None else now
+    waiting = [request for request in list(reserved) if request not in active]
+    stamps = []
+    for request in waiting:
+        try:
+            stamps.append(float(request.request_dict.get(ENQUEUED_AT_HEADER)))
+        except (TypeError, ValueError, AttributeError):
+            pass # Unstamped (e.g. Node API), counted but not aged
+    oldest_age = max(0.0, now - min(stamps)) if stamps else None
+    return len(waiting), oldest_age
+
+
+class QueueDepthAutoscaler(Autoscaler):
+    """
+    Grows/shrinks the number of browser slots (pool processes) from scrape queue
+    depth, oldest message age, node CPU and free memory. Jobs this worker has already
+    prefetched from Redis but not started count as queued too.
+
+    Enabled with `celery worker --autoscale=MAX,MIN` (see run_worker.sh).
+    - Scales up one slot per poll while jobs wait longer than AUTOSCALE_TARGET_WAIT_SECONDS
+      (or more jobs are queued than there are slots), as long as CPU and memory allow it.
+    - Scales down one slot only after the queue has stayed below the low watermark for
+      AUTOSCALE_SCALE_DOWN_DELAY_SECONDS (hysteresis), or immediately on memory pressure.
+    - Shrinking goes through pool.shrink(), which only retires idle processes, so a slot
+      in the middle of a scrape always finishes its job first.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # With the prefork event loop Celery only calls maybe_scale every `keepalive` seconds
+        # (and on task messages), so tie that timer to our poll interval. This is read after
+        # the autoscaler is created, so it takes effect on idle nodes too.
+        self.keepalive = settings.AUTOSCALE_POLL_SECONDS
+        self._redis = None
+        self._last_poll = 0.0
+        self._calm_since = None # When the queue last dropped below the low watermark
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=2)
+        return self._redis
+
+    def read_metrics(self):
+        """Returns a metrics dict, or None if Redis could not be read."""
+        try:
+            depth, oldest_age = read_queue_stats(self.redis, settings.SCRAPE_QUEUE_NAME)
+        except redis.RedisError as exc:
+            logger.warning(f"[Autoscaler] Could not read queue stats: {exc}")
+            return None
+        local_depth, local_age = read_local_backlog(worker_state.reserved_requests, worker_state.active_requests)
+        if local_depth:
+            # Prefetched jobs left the queue first, so they are usually the oldest ones waiting
+            ages = [age for age in (oldest_age if depth else None, local_age) if age is not None]
+            oldest_age = max(ages) if ages else None
+            depth += local_depth
+        return {
+            'depth': depth,
+            'oldest_age': oldest_age,
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'free_memory_mb': psutil.virtual_memory().available / (1024 * 1024),
+        }
+
+    def desired_slots(self, metrics, procs, now):
+        """Decides the slot count for this poll. Pure apart from the hysteresis timer."""
+        target_wait = settings.AUTOSCALE_TARGET_WAIT_SECONDS
+        depth = metrics['depth']
+        oldest_age = metrics['oldest_age']
+        free_mb = metrics['free_memory_mb']
+
+        # Memory guard comes first and skips hysteresis: a swapping node helps nobody
+        if free_mb < settings.AUTOSCALE_MIN_FREE_MEMORY_MB:
+            self._calm_since = None
+            return max(self.min_concurrency, procs - 1)
+
+        behind = depth > procs or (oldest_age is not None and oldest_age > target_wait)
+        if behind:
+            self._calm_since = None
+            has_headroom = (
+                metrics['cpu_percent'] < settings.AUTOSCALE_MAX_CPU_PERCENT and
+                free_mb - settings.AUTOSCALE_MEMORY_PER_SLOT_MB >= settings.AUTOSCALE_MIN_FREE_MEMORY_MB
+            )
+            if has_headroom:
+                return min(self.max_concurrency, procs + 1)
+            return procs
+
+        if oldest_age is None:
+            # No enqueued_at stamp (e.g. Node API or older messages): not behind, so judge on depth alone
+            calm = depth <= procs
+        else:
+            calm = depth == 0 or oldest_age < target_wait * settings.AUTOSCALE_LOW_WATERMARK_RATIO
+        if not calm:
+            # Between the watermarks: hold steady
+            self._calm_since = None
+            return procs
+        if self._calm_since is None:
+            self._calm_since = now
+            return procs
+        if now - self._calm_since >= settings.AUTOSCALE_SCALE_DOWN_DELAY_SECONDS:
+            self._calm_since = now # Restart the timer so we step down one slot at a time
+            return max(self.min_concurrency, procs - 1)
+        return procs
+
+    def _maybe_scale(self, req=None):
+        now = monotonic()
+        procs = self.processes
+        # Always honour the configured bounds, even between polls
+        if procs < self.min_concurrency:
+            self.scale_up(self.min_concurrency - procs)
+            return True
+        # 10% slack so the keepalive timer firing a hair early doesn't skip every other poll
+        if now - self._last_poll < settings.AUTOSCALE_POLL_SECONDS * 0.9:
+            return False
+        self._last_poll = now
+
+        metrics = self.read_metrics()
+        if metrics is None:
+            return False # Keep the current slot count until Redis is reachable again
+
+        desired = self.desired_slots(metrics, procs, now)
+        if desired != procs:
+            age = metrics['oldest_age']
+            logger.info(
+                f"[Autoscaler] slots {procs} -> {desired} (depth={metrics['depth']}, "
+                f"oldest_age={'n/a' if age is None else f'{age:.0f}s'}, cpu={metrics['cpu_percent']:.0f}%, "
+                f"free_mem={metrics['free_memory_mb']:.0f}MB)"
+            )
+        if desired > procs:
+            self.scale_up(desired - procs)
+            return True
+        if desired < procs:
+            # Bypass Autoscaler.scale_down's keepalive gate: hysteresis is handled above
+            self._shrink(procs - desired)
+            return True
+        return False
@@ -1,5 +1,7 @@
 # src/celery_app.py
+import time
 from celery import Celery
+from celery.signals import before_task_publish
 from src.config import settings # Import our centralized settings
 
 # Initialize Celery
@@ -18,13 +20,28 @@ celery_app.conf.update(
     task_serializer='json',       # Use JSON for task messages
     accept_content=['json'],      # Accept JSON content
     result_serializer='json',     # Store results as JSON
+    result_extended=True,         # Keep retries/worker/queue in results (read by load_test.py)
     timezone='UTC',               # Use UTC timezone
     enable_utc=True,
     # Set a default task timeout slightly less than the scraper timeout
     task_time_limit=settings.SCRAPER_TIMEOUT_SECONDS - 10,
     task_soft_time_limit=settings.SCRAPER_TIMEOUT_SECONDS - 20,
+    # Route jobs to the configured scrape queue so its depth can be measured in Redis
+    task_default_queue=settings.SCRAPE_QUEUE_NAME,
+    # Each slot holds one browser, so prefetch one job per slot. Under --autoscale Celery
+    # prefetches for AUTOSCALE_MAX_SLOTS; the autoscaler counts those jobs as still queued
+    worker_prefetch_multiplier=1,
+    # Used when the worker is started with --autoscale
+    worker_autoscaler='src.autoscaler:QueueDepthAutoscaler',
 )
 
+
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    """Records publish time so the autoscaler can measure how long jobs wait."""
+    if headers is not None:
+        headers.setdefault('enqueued_at', time.time())
+
 if __name__ == '__main__':
     # Allows starting worker via 'python -m src.celery_app worker ...' if needed
     celery_app.start()
\ No newline at end of file
@@ -1,5 +1,6 @@
 # src/config/settings.py
 import os
+import json
 from dotenv import load_dotenv
 
 # Load variables from .env file into environment
@@ -12,10 +13,49 @@ SCRAPE_QUEUE_NAME = os.getenv("SCRAPE_QUEUE_NAME", "media-scrape-jobs")
 # Worker Config
 WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
 
+# Autoscaling Config (used when the worker runs with --autoscale, see run_worker.sh)
+AUTOSCALE_ENABLED = os.getenv("AUTOSCALE_ENABLED", "false").lower() == "true"
+AUTOSCALE_MIN_SLOTS = int(os.getenv("AUTOSCALE_MIN_SLOTS", "1"))
+AUTOSCALE_MAX_SLOTS = int(os.getenv("AUTOSCALE_MAX_SLOTS", "4")) # Same default as run_worker.sh
+AUTOSCALE_TARGET_WAIT_SECONDS = float(os.getenv("AUTOSCALE_TARGET_WAIT_SECONDS", "30")) # Max acceptable queue wait
+AUTOSCALE_LOW_WATERMARK_RATIO = float(os.getenv("AUTOSCALE_LOW_WATERMARK_RATIO", "0.25")) # Scale down below target * ratio
+AUTOSCALE_SCALE_DOWN_DELAY_SECONDS = float(os.getenv("AUTOSCALE_SCALE_DOWN_DELAY_SECONDS", "120"))
+AUTOSCALE_POLL_SECONDS = float(os.getenv("AUTOSCALE_POLL_SECONDS", "5")) # Also used as Celery's autoscaler timer
+AUTOSCALE_MAX_CPU_PERCENT = float(os.getenv("AUTOSCALE_MAX_CPU_PERCENT", "85"))
+AUTOSCALE_MIN_FREE_MEMORY_MB = int(os.getenv("AUTOSCALE_MIN_FREE_MEMORY_MB", "1024"))
+AUTOSCALE_MEMORY_PER_SLOT_MB = int(os.getenv("AUTOSCALE_MEMORY_PER_SLOT_MB", "600")) # Rough RAM cost of one Chrome
+
 # Scraper Config
 SCRAPER_HEADLESS = os.getenv("HEADLESS_MODE", "true").lower() == "true"
 SCRAPER_TIMEOUT_SECONDS = int(os.getenv("BROWSER_TIMEOUT", "120"))
 
+# Network capture backend: 'seleniumwire' (MITM proxy) or 'cdp' (Chrome DevTools Protocol)
+CAPTURE_BACKEND = os.getenv("CAPTURE_BACKEND", "seleniumwire").lower()
+CAPTURE_BUFFER_SIZE = int(os.getenv("CAPTURE_BUFFER_SIZE", "50")) # Max manifest responses kept per session (cdp only)
+
+# Series (season-wide) Config
+SERIES_MAX_EPISODES = int(os.getenv("SERIES_MAX_EPISODES", "30")) # Hard cap per series job
+SERIES_TIMEOUT_SECONDS = int(os.getenv("SERIES_TIMEOUT", str(SCRAPER_TIMEOUT_SECONDS * 10))) # One session walks many episodes
+
+# Per-domain Rate Limiting Config (shared across all workers through Redis)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_DEFAULT_RPM = float(os.getenv("RATE_LIMIT_DEFAULT_RPM", "20")) # Scrapes per minute per host (ceiling)
+RATE_LIMIT_DEFAULT_BURST = float(os.getenv("RATE_LIMIT_DEFAULT_BURST", "5"))
+RATE_LIMIT_DEFAULT_CONCURRENCY = int(os.getenv("RATE_LIMIT_DEFAULT_CONCURRENCY", "4")) # Simultaneous browsers per host
+RATE_LIMIT_MIN_RPM = float(os.getenv("RATE_LIMIT_MIN_RPM", "1")) # Floor when a host keeps blocking us
+RATE_LIMIT_RECOVERY_RPM = float(os.getenv("RATE_LIMIT_RECOVERY_RPM", "0.5")) # Added back per clean scrape
+RATE_LIMIT_BLOCK_FACTOR = float(os.getenv("RATE_LIMIT_BLOCK_FACTOR", "0.5")) # Rate multiplier per observed block
+RATE_LIMIT_SLOT_RETRY_SECONDS = int(os.getenv("RATE_LIMIT_SLOT_RETRY_SECONDS", "15")) # Max defer when slots are busy
+RATE_LIMIT_MAX_DEFERRALS = int(os.getenv("RATE_LIMIT_MAX_DEFERRALS", "40"))
+RATE_LIMIT_MAX_LEASE_SECONDS = int(os.getenv("RATE_LIMIT_MAX_LEASE_SECONDS", "300")) # Slot lease cap; running jobs renew it
+RATE_LIMIT_LEASE_MARGIN_SECONDS = int(os.getenv("RATE_LIMIT_LEASE_MARGIN_SECONDS", "30")) # Added on top of the lease
+RATE_LIMIT_EPISODE_MAX_WAIT_SECONDS = int(os.getenv("RATE_LIMIT_EPISODE_MAX_WAIT_SECONDS", "60")) # Series stops early past this wait
+# Optional per-host overrides, e.g. {"ww19.0123movie.net": {"rpm": 6, "concurrency": 2}}
+RATE_LIMIT_OVERRIDES = json.loads(os.getenv("RATE_LIMIT_OVERRIDES", "{}") or "{}")
+if not isinstance(RATE_LIMIT_OVERRIDES, dict):
+    raise ValueError("RATE_LIMIT_OVERRIDES must be a JSON object mapping host to limits")
+RATE_LIMIT_OVERRIDES = {host.lower(): limits for host, limits in RATE_LIMIT_OVERRIDES.items()}
+
 # Proxy Config (read only if enabled)
 PROXY_ENABLED = os.getenv("PROXY_ENABLED", "false").lower() == "true"
 PROXY_CONFIG = None
@@ -44,13 +84,37 @@ if PROXY_ENABLED:
 # Validate mandatory settings
 if not REDIS_URL or not SCRAPE_QUEUE_NAME:
     raise ValueError("REDIS_URL and SCRAPE_QUEUE_NAME must be set in .env")
+if AUTOSCALE_MIN_SLOTS < 0 or AUTOSCALE_MAX_SLOTS < max(AUTOSCALE_MIN_SLOTS, 1):
+    raise ValueError("AUTOSCALE_MAX_SLOTS must be >= AUTOSCALE_MIN_SLOTS and >= 1")
+if AUTOSCALE_POLL_SECONDS <= 0:
+    raise ValueError("AUTOSCALE_POLL_SECONDS must be > 0")
+if RATE_LIMIT_MIN_RPM <= 0 or RATE_LIMIT_DEFAULT_RPM < RATE_LIMIT_MIN_RPM or RATE_LIMIT_DEFAULT_BURST < 1:
+    raise ValueError("RATE_LIMIT_DEFAULT_RPM must be >= RATE_LIMIT_MIN_RPM > 0 and RATE_LIMIT_DEFAULT_BURST >= 1")
+if RATE_LIMIT_LEASE_MARGIN_SECONDS < 0 or RATE_LIMIT_EPISODE_MAX_WAIT_SECONDS < 0:
+    raise ValueError("RATE_LIMIT_LEASE_MARGIN_SECONDS and RATE_LIMIT_EPISODE_MAX_WAIT_SECONDS must be >= 0")
+if RATE_LIMIT_MAX_LEASE_SECONDS < 30:
+    raise ValueError("RATE_LIMIT_MAX_LEASE_SECONDS must be >= 30")
+for _host, _limits in RATE_LIMIT_OVERRIDES.items():
+    if not isinstance(_limits, dict) or not set(_limits) <= {"rpm", "burst", "concurrency"}:
+        raise ValueError(f"RATE_LIMIT_OVERRIDES['{_host}'] must be an object with only 'rpm', 'burst' and 'concurrency'")
+    if any(isinstance(_v, bool) or not isinstance(_v, (int, float)) for _v in _limits.values()):
+        raise ValueError(f"RATE_LIMIT_OVERRIDES['{_host}'] values must be numbers")
+    if _limits.get("rpm", RATE_LIMIT_MIN_RPM) < RATE_LIMIT_MIN_RPM or _limits.get("burst", 1) < 1 or _limits.get("concurrency", 1) < 1:
+        raise ValueError(f"RATE_LIMIT_OVERRIDES['{_host}'] needs rpm >= RATE_LIMIT_MIN_RPM, burst >= 1 and concurrency >= 1")
+if CAPTURE_BACKEND not in ("seleniumwire", "cdp"):
+    raise ValueError("CAPTURE_BACKEND must be 'seleniumwire' or 'cdp'")
 
 print(f"--- Worker Configuration ---")
 print(f"Redis URL: {'Configured (check .env)' if REDIS_URL else 'MISSING!'}")
 print(f"Scrape Queue Name: {SCRAPE_QUEUE_NAME}")
-print(f"Concurrency: {WORKER_CONCURRENCY}")
+if AUTOSCALE_ENABLED:
+    print(f"Concurrency: autoscale {AUTOSCALE_MIN_SLOTS}-{AUTOSCALE_MAX_SLOTS} (target wait {AUTOSCALE_TARGET_WAIT_SECONDS}s)")
+else:
+    print(f"Concurrency: {WORKER_CONCURRENCY}")
 print(f"Scraper Headless: {SCRAPER_HEADLESS}")
 print(f"Scraper Timeout (s): {SCRAPER_TIMEOUT_SECONDS}")
+print(f"Capture Backend: {CAPTURE_BACKEND}")
+print(f"Rate Limit: {f'{RATE_LIMIT_DEFAULT_RPM}/min, {RATE_LIMIT_DEFAULT_CONCURRENCY} concurrent per host' if RATE_LIMIT_ENABLED else 'disabled'}")
 print(f"Proxy Enabled: {PROXY_ENABLED}")
 print(f"--------------------------")
 
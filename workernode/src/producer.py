@@ -0,0 +1,161 @@
+# src/producer.py
+"""
+Lightweight producer for scrape jobs.
+
+Writes Celery protocol v2 messages straight onto the kombu Redis queue, so a
+service that only *sends* jobs needs nothing but redis-py. It deliberately does
+not import celery, the scraper stack or src.config.settings (which prints its
+banner on import); REDIS_URL and SCRAPE_QUEUE_NAME are read from the environment
+with the same defaults as settings.py.
+
+    from src.producer import enqueue_scrape, enqueue_many
+    task_id = enqueue_scrape('https://site/movie/x.html', 'x', 'movie')
+    task_ids = enqueue_many([{'targetUrl': ..., 'mediaId': ..., 'mediaType': ...}, ...])
+"""
+import base64
+import json
+import os
+import socket
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import redis
+
+SCRAPE_TASK_NAME = 'src.tasks.scrape_tasks.process_scrape_request'
+SERIES_TASK_NAME = 'src.tasks.scrape_tasks.process_series_request'
+MEDIA_TYPES = ('movie', 'tv')
+PIPELINE_CHUNK_SIZE = 500 # Messages per Redis round trip in enqueue_many
+
+_clients = {}
+
+
+def _get_client(redis_url=None):
+    """Returns a cached Redis client for the given (or configured) URL."""
+    url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    if url not in _clients:
+        _clients[url] = redis.Redis.from_url(url)
+    return _clients[url]
+
+
+def _default_queue():
+    return os.getenv("SCRAPE_QUEUE_NAME", "media-scrape-jobs")
+
+
+def validate_job_data(job_data):
+    """Checks a job payload against the schema process_scrape_request expects. Raises ValueError."""
+    if not isinstance(job_data, dict):
+        raise ValueError("job_data must be a dict.")
+    target_url = job_data.get('targetUrl')
+    if not isinstance(target_url, str) or urlsplit(target_url).scheme not in ('http', 'https') or not urlsplit(target_url).netloc:
+        raise ValueError(f"job_data 'targetUrl' must be an http(s) URL, got: {target_url!r}")
+    media_id = job_data.get('mediaId')
+    if not isinstance(media_id, str) or not media_id:
+        raise ValueError(f"job_data 'mediaId' must be a non-empty string, got: {media_id!r}")
+    media_type = job_data.get('mediaType')
+    if media_type not in MEDIA_TYPES:
+        raise ValueError(f"job_data 'mediaType' must be one of {MEDIA_TYPES}, got: {media_type!r}")
+    return {'targetUrl': target_url, 'mediaId': media_id, 'mediaType': media_type}
+
+
+def validate_series_data(job_data):
+    """Checks a series payload for process_series_request. Raises ValueError."""
+    if not isinstance(job_data, dict):
+        raise ValueError("job_data must be a dict.")
+    payload = validate_job_data(dict(job_data, mediaType='tv'))
+    season = job_data.get('season')
+    if season is not None:
+        if not isinstance(season, int) or isinstance(season, bool) or season < 1:
+            raise ValueError(f"job_data 'season' must be a positive int, got: {season!r}")
+        payload['season'] = season
+    episodes = job_data.get('episodes')
+    if episodes is not None:
+        if not isinstance(episodes, list) or not all(isinstance(e, int) and not isinstance(e, bool) and e > 0 for e in episodes):
+            raise ValueError(f"job_data 'episodes' must be a list of positive ints, got: {episodes!r}")
+        payload['episodes'] = episodes
+    return payload
+
+
+def build_message(task_name, args, queue, task_id=None):
+    """Builds the JSON envelope a Celery worker expects on a kombu Redis queue."""
+    task_id = task_id or str(uuid.uuid4())
+    body = [list(args), {}, {'callbacks': None, 'errbacks': None, 'chain': None, 'chord': None}]
+    message = {
+        'body': base64.b64encode(json.dumps(body).encode('utf-8')).decode('ascii'),
+        'content-encoding': 'utf-8',
+        'content-type': 'application/json',
+        'headers': {
+            'lang': 'py',
+            'task': task_name,
+            'id': task_id,
+            'shadow': None,
+            'eta': None,
+            'expires': None,
+            'group': None,
+            'group_index': None,
+            'retries': 0,
+            'timelimit': [None, None],
+            'root_id': task_id,
+            'parent_id': None,
+            'argsrepr': repr(list(args)),
+            'kwargsrepr': '{}',
+            'origin': f"{os.getpid()}@{socket.gethostname()}",
+            'ignore_result': False,
+            'enqueued_at': time.time(), # Same stamp celery_app.py adds; read by the autoscaler
+        },
+        'properties': {
+            'correlation_id': task_id,
+            'reply_to': '',
+            'delivery_mode': 2,
+            'delivery_info': {'exchange': '', 'routing_key': queue},
+            'priority': 0,
+            'body_encoding': 'base64',
+            'delivery_tag': str(uuid.uuid4()),
+        },
+    }
+    return task_id, json.dumps(message)
+
+
+def enqueue_scrape(target_url, media_id, media_type='movie', queue=None, redis_url=None):
+    """Validates and sends one scrape job. Returns the Celery task id."""
+    job_data = validate_job_data({'targetUrl': target_url, 'mediaId': media_id, 'mediaType': media_type})
+    queue = queue or _default_queue()
+    task_id, message = build_message(SCRAPE_TASK_NAME, [job_data], queue)
+    _get_client(redis_url).lpush(queue, message)
+    return task_id
+
+
+def enqueue_series(target_url, media_id, season=None, episodes=None, queue=None, redis_url=None):
+    """Validates and sends one season-wide TV job. Returns the Celery task id; poll get_result() for PROGRESS."""
+    job_data = validate_series_data({'targetUrl': target_url, 'mediaId': media_id,
+                                     'season': season, 'episodes': episodes})
+    queue = queue or _default_queue()
+    task_id, message = build_message(SERIES_TASK_NAME, [job_data], queue)
+    _get_client(redis_url).lpush(queue, message)
+    return task_id
+
+
+def enqueue_many(jobs, queue=None, redis_url=None):
+    """
+    Validates and sends many scrape jobs using pipelined LPUSHes.
+    All payloads are validated before anything is sent. Returns task ids in input order.
+    """
+    payloads = [validate_job_data(job_data) for job_data in jobs]
+    queue = queue or _default_queue()
+    client = _get_client(redis_url)
+
+    task_ids = []
+    for start in range(0, len(payloads), PIPELINE_CHUNK_SIZE):
+        pipe = client.pipeline(transaction=False)
+        for job_data in payloads[start:start + PIPELINE_CHUNK_SIZE]:
+            task_id, message = build_message(SCRAPE_TASK_NAME, [job_data], queue)
+            pipe.lpush(queue, message)
+            task_ids.append(task_id)
+        pipe.execute()
+    return task_ids
+
+
+def get_result(task_id, redis_url=None):
+    """Returns the stored result meta for a task id ({'status': ..., 'result': ...}), or None if nothing is stored yet."""
+    raw = _get_client(redis_url).get(f"celery-task-meta-{task_id}")
+    return json.loads(raw) if raw else None
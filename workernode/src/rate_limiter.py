@@ -0,0 +1,259 @@
+# src/rate_limiter.py
+"""
+Cluster-wide per-domain rate limiting for scrape jobs.
+
+Every worker shares the same Redis state, so limits hold across the whole fleet:
+- a token bucket per host (requests/minute + burst), and
+- a concurrency semaphore per host (leases in a sorted set that expire on their own
+  if a worker dies mid-job).
+
+A job gates on its target domain plus the few embed hosts most recently seen
+behind that domain (at most MAX_EMBED_HOSTS, forgotten after EMBED_HOST_MAX_AGE_SECONDS).
+Acquisition is all-or-nothing and never blocks: when a host is out of tokens or
+slots, the caller gets a retry delay and defers the job instead. Leases are short
+(at most RATE_LIMIT_MAX_LEASE_SECONDS plus a margin) and renewed by the running job,
+so a worker that dies without releasing only holds its slots until the lease runs out.
+Jobs that load several pages take one extra token per page with take_token().
+
+Each host's rate adapts to observed blocks (AIMD): a challenge/ban page on that host
+halves its rate down to RATE_LIMIT_MIN_RPM, every clean scrape adds RATE_LIMIT_RECOVERY_RPM
+back up to the configured ceiling.
+"""
+import logging
+import math
+import time
+from urllib.parse import urlsplit
+
+import redis
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ratelimit'
+STATE_TTL_SECONDS = 86400 # Idle hosts are forgotten after a day
+MAX_EMBED_HOSTS = 3 # Embed hosts gated per domain, most recently seen first
+EMBED_HOST_MAX_AGE_SECONDS = 6 * 3600 # Embed hosts not seen for this long stop being gated
+
+# KEYS: per host [bucket, semaphore, rate] * n
+# ARGV: lease_id, lease_seconds, slot_retry_seconds, state_ttl, then per host [ceiling_rpm, burst, concurrency] * n
+# lease_seconds <= 0 takes tokens only and leaves the semaphores alone.
+# Returns {1, 0} when every host granted, else {0, wait_ms}. Nothing is consumed on denial.
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local lease_id = ARGV[1]
+local lease_seconds = tonumber(ARGV[2])
+local slot_retry = tonumber(ARGV[3])
+local state_ttl = tonumber(ARGV[4])
+local hosts = #KEYS / 3
+local tokens_after = {}
+local wait = 0
+
+for i = 0, hosts - 1 do
+    local bucket, sem, rate_key = KEYS[i*3+1], KEYS[i*3+2], KEYS[i*3+3]
+    local ceiling = tonumber(ARGV[i*3+5])
+    local burst = tonumber(ARGV[i*3+6])
+    local concurrency = tonumber(ARGV[i*3+7])
+    local rate = math.min(ceiling, tonumber(redis.call('GET', rate_key)) or ceiling)
+
+    local state = redis.call('HMGET', bucket, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate / 60)
+    tokens_after[i] = tokens
+
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) * 60 / rate)
+    end
+
+    if lease_seconds > 0 then
+        redis.call('ZREMRANGEBYSCORE', sem, '-inf', now)
+        if redis.call('ZCARD', sem) >= concurrency then
+            local oldest = redis.call('ZRANGE', sem, 0, 0, 'WITHSCORES')
+            local until_free = oldest[2] and (tonumber(oldest[2]) - now) or lease_seconds
+            wait = math.max(wait, math.min(until_free, slot_retry))
+        end
+    end
+end
+
+if wait > 0 then
+    return {0, math.ceil(wait * 1000)}
+end
+
+for i = 0, hosts - 1 do
+    local bucket, sem = KEYS[i*3+1], KEYS[i*3+2]
+    redis.call('HSET', bucket, 'tokens', tostring(tokens_after[i] - 1), 'ts', tostring(now))
+    redis.call('EXPIRE', bucket, state_ttl)
+    if lease_seconds > 0 then
+        redis.call('ZADD', sem, now + lease_seconds, lease_id)
+        -- Key lives as long as its longest lease; stale members are pruned on every acquire
+        if redis.call('TTL', sem) < lease_seconds then
+            redis.call('EXPIRE', sem, math.ceil(lease_seconds))
+        end
+    end
+end
+return {1, 0}
+"""
+
+# KEYS: per host [semaphore] * n  ARGV: lease_id, lease_seconds
+# Pushes out the expiry of a lease the job still holds; an already expired lease is not revived.
+RENEW_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local lease_seconds = tonumber(ARGV[2])
+local renewed = 0
+for i = 1, #KEYS do
+    local score = redis.call('ZSCORE', KEYS[i], ARGV[1])
+    if score and tonumber(score) > now then
+        redis.call('ZADD', KEYS[i], now + lease_seconds, ARGV[1])
+        if redis.call('TTL', KEYS[i]) < lease_seconds then
+            redis.call('EXPIRE', KEYS[i], math.ceil(lease_seconds))
+        end
+        renewed = renewed + 1
+    end
+end
+return renewed
+"""
+
+# KEYS: [rate]  ARGV: [ceiling_rpm, min_rpm, recovery_rpm, decrease_factor, blocked(0/1), state_ttl]
+RECORD_OUTCOME_SCRIPT = """
+local ceiling = tonumber(ARGV[1])
+local rate = math.min(ceiling, tonumber(redis.call('GET', KEYS[1])) or ceiling)
+if ARGV[5] == '1' then
+    rate = math.max(tonumber(ARGV[2]), rate * tonumber(ARGV[4]))
+else
+    rate = math.min(ceiling, rate + tonumber(ARGV[3]))
+end
+redis.call('SET', KEYS[1], tostring(rate), 'EX', tonumber(ARGV[6]))
+return tostring(rate)
+"""
+
+
+def host_of(url):
+    """Lower-cased hostname of a URL, or None."""
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return None
+    return host.lower() if host else None
+
+
+def limits_for(host):
+    """Returns {'rpm', 'burst', 'concurrency'} for a host: defaults merged with RATE_LIMIT_OVERRIDES."""
+    limits = {
+        'rpm': settings.RATE_LIMIT_DEFAULT_RPM,
+        'burst': settings.RATE_LIMIT_DEFAULT_BURST,
+        'concurrency': settings.RATE_LIMIT_DEFAULT_CONCURRENCY,
+    }
+    limits.update(settings.RATE_LIMIT_OVERRIDES.get(host, {}))
+    return limits
+
+
+class DomainRateLimiter:
+    """Redis-backed token bucket + concurrency cap shared by all workers."""
+
+    def __init__(self, redis_client=None):
+        self._redis = redis_client
+        self._acquire = None
+        self._renew = None
+        self._record = None
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=2)
+        return self._redis
+
+    def _scripts(self):
+        if self._acquire is None:
+            self._acquire = self.redis.register_script(ACQUIRE_SCRIPT)
+            self._renew = self.redis.register_script(RENEW_SCRIPT)
+            self._record = self.redis.register_script(RECORD_OUTCOME_SCRIPT)
+        return self._acquire, self._renew, self._record
+
+    def hosts_for(self, target_url):
+        """Target domain plus the embed hosts most recently seen behind it (see record_embed_host)."""
+        domain = host_of(target_url)
+        if not domain:
+            return []
+        embeds = self.redis.zrevrangebyscore(
+            f"{KEY_PREFIX}:embed-hosts:{domain}", '+inf', time.time() - EMBED_HOST_MAX_AGE_SECONDS,
+            start=0, num=MAX_EMBED_HOSTS,
+        )
+        return [domain] + [e.decode() if isinstance(e, bytes) else e for e in embeds if e]
+
+    def try_acquire(self, hosts, lease_id, lease_seconds):
+        """
+        Takes one token and one concurrency slot on every host, or nothing at all.
+        The slots expire on their own after lease_seconds if release() is never called.
+        Returns (True, 0) on success, (False, seconds_to_wait) when the job should be deferred.
+        """
+        return self._run_acquire(hosts, lease_id, lease_seconds)
+
+    def take_token(self, hosts):
+        """
+        Takes one more token on every host (or none) without touching the concurrency slots,
+        for each extra page a job loads. Returns (granted, seconds_to_wait) like try_acquire.
+        """
+        return self._run_acquire(hosts, '', 0)
+
+    def _run_acquire(self, hosts, lease_id, lease_seconds):
+        if not hosts:
+            return True, 0
+        acquire, _, _ = self._scripts()
+        keys, args = [], [lease_id, lease_seconds, settings.RATE_LIMIT_SLOT_RETRY_SECONDS, STATE_TTL_SECONDS]
+        for host in hosts:
+            limits = limits_for(host)
+            keys += [f"{KEY_PREFIX}:{host}:bucket", f"{KEY_PREFIX}:{host}:sem", f"{KEY_PREFIX}:{host}:rate"]
+            args += [limits['rpm'], limits['burst'], limits['concurrency']]
+        granted, wait_ms = acquire(keys=keys, args=args)
+        return bool(granted), math.ceil(int(wait_ms) / 1000)
+
+    def renew(self, hosts, lease_id, lease_seconds):
+        """Extends the job's slots to lease_seconds from now. Returns how many were still held."""
+        if not hosts:
+            return 0
+        _, renew, _ = self._scripts()
+        return int(renew(keys=[f"{KEY_PREFIX}:{host}:sem" for host in hosts], args=[lease_id, lease_seconds]))
+
+    def release(self, hosts, lease_id):
+        """Frees the concurrency slots taken by try_acquire."""
+        if not hosts:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for host in hosts:
+            pipe.zrem(f"{KEY_PREFIX}:{host}:sem", lease_id)
+        pipe.execute()
+
+    def record_embed_host(self, target_url, embed_host):
+        """
+        Remembers that target_url's domain loads its player from embed_host.
+        Hosts are scored by when they were last seen; only the newest MAX_EMBED_HOSTS are kept.
+        """
+        domain = host_of(target_url)
+        if not domain or not embed_host or embed_host == domain:
+            return
+        now = time.time()
+        key = f"{KEY_PREFIX}:embed-hosts:{domain}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(key, {embed_host: now})
+        pipe.zremrangebyscore(key, '-inf', now - EMBED_HOST_MAX_AGE_SECONDS)
+        pipe.zremrangebyrank(key, 0, -(MAX_EMBED_HOSTS + 1))
+        pipe.expire(key, EMBED_HOST_MAX_AGE_SECONDS)
+        pipe.execute()
+
+    def record_outcome(self, hosts, blocked):
+        """Feeds a scrape outcome back into each host's adaptive rate. Returns {host: new_rpm}."""
+        _, _, record = self._scripts()
+        new_rates = {}
+        for host in hosts:
+            new_rates[host] = float(record(
+                keys=[f"{KEY_PREFIX}:{host}:rate"],
+                args=[limits_for(host)['rpm'], settings.RATE_LIMIT_MIN_RPM, settings.RATE_LIMIT_RECOVERY_RPM,
+                      settings.RATE_LIMIT_BLOCK_FACTOR, 1 if blocked else 0, STATE_TTL_SECONDS],
+            ))
+        if blocked:
+            logger.warning(f"[RateLimiter] Block observed, rates lowered: {new_rates}")
+        return new_rates
+
@@ -6,9 +6,6 @@ import re
 import requests
 # Keep uc for ChromeOptions if you prefer, or use seleniumwire's uc options
 import undetected_chromedriver as uc
-# --- MODIFIED IMPORT: Import the combined Chrome class from seleniumwire's integration ---
-from seleniumwire.undetected_chromedriver import Chrome as SwUcChrome
-# --- END MODIFIED IMPORT ---
 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -26,10 +23,11 @@ from selenium.webdriver.common.action_chains import ActionChains
 # Removed unused import: from seleniumwire.undetected_chromedriver import ChromeOptions
 
 from src.config import settings
+from src.scrapers.network_capture import get_capture_backend
 import os
 
-def configure_driver(proxy_config=None):
-    """Configures and returns Chrome options and Selenium Wire options."""
+def configure_driver():
+    """Configures and returns Chrome options. Proxy setup is left to the capture backend."""
     # You can still use uc.ChromeOptions here if desired
     options = uc.ChromeOptions()
     # Standard options
@@ -92,21 +90,7 @@ def configure_driver(proxy_config=None):
         options.add_argument('--disable-gpu')
         options.add_argument('--window-size=1920,1080')
 
-    # Selenium Wire options dictionary
-    sw_options = {}
-    if proxy_config and 'proxy' in proxy_config and 'https' in proxy_config['proxy']:
-        # Ensure correct structure for selenium-wire options
-        sw_options = {'proxy': proxy_config['proxy']}
-        # Log only host/port if possible
-        proxy_host_port = proxy_config['proxy']['https'].split('@')[-1]
-        print(f"[Scraper] Configuring proxy via Selenium Wire: {proxy_host_port}")
-        # Many streaming sites detect and block datacenter IPs
-        # Residential proxies are recommended for production use
-    elif proxy_config:
-        print("[Scraper] WARNING: Proxy config provided but structure is incorrect or missing 'https' key.")
-
-
-    return options, sw_options
+    return options
 
 def is_valid_m3u8(url):
     """Validate if URL contains actual M3U8 content."""
@@ -303,232 +287,260 @@ def handle_common_overlay_patterns(driver, wait, log_prefix=""):
     return clicked_something
 
 
-async def scrape_for_m3u8(target_url: str, job_id: str, proxy_config: dict | None = None) -> str | None:
-    """
-    Enhanced scraper for M3U8 URLs from streaming sites using selenium-wire's uc integration,
-    with better interception, overlay handling, iframe support, and content validation.
-    Returns the M3U8 URL string or None if not found.
-    """
-    log_prefix = f"[Scraper Job {job_id}]"
-    print(f"{log_prefix} Starting enhanced scrape for: {target_url}")
-    m3u8_url = None
-    driver = None # Initialize driver to None
-
-    options, sw_options = configure_driver(proxy_config)
-
+def resolve_driver_executable(log_prefix=""):
+    """Returns the bundled chromedriver path if present, else None so uc manages the driver."""
     script_dir = os.path.dirname(__file__)
     project_root = os.path.dirname(os.path.dirname(script_dir))
     driver_path_explicit = os.path.join(project_root, 'drivers', 'chromedriver.exe')
 
-    driver_executable = None # Default to None (uc handles download)
     if os.path.exists(driver_path_explicit):
         print(f"{log_prefix} Attempting to use explicit driver path: {driver_path_explicit}")
-        driver_executable = driver_path_explicit
+        return driver_path_explicit
+    print(f"{log_prefix} INFO: Explicit driver not found at '{driver_path_explicit}'. Letting undetected-chromedriver manage driver download/path.")
+    return None # Default to None (uc handles download)
+
+
+def start_browser(capture, proxy_config, log_prefix=""):
+    """Launches Chrome through the capture backend and applies standard timeouts. Returns (driver, wait)."""
+    options = configure_driver()
+    driver_executable = resolve_driver_executable(log_prefix)
+    driver = capture.start_driver(options, proxy_config, driver_executable, log_prefix)
+
+    print(f"{log_prefix} Driver initialized.")
+    # Set timeouts
+    driver.set_page_load_timeout(settings.SCRAPER_TIMEOUT_SECONDS)
+    driver.implicitly_wait(5) # Small implicit wait can sometimes help stabilize element finding
+    wait = WebDriverWait(driver, 20) # Slightly shorter explicit wait default
+    return driver, wait
+
+
+def load_page(driver, wait, target_url, log_prefix=""):
+    """Navigates to target_url, waits for the body, then pauses and scrolls like a person would."""
+    print(f"{log_prefix} Navigating to {target_url}...")
+    driver.get(target_url)
+
+    # Wait for page body tag to ensure basic page structure is loaded
+    try:
+        wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+        print(f"{log_prefix} Page loaded. Body tag found.")
+    except TimeoutException:
+        print(f"{log_prefix} Warning: Timed out waiting for body tag. Page might be malformed or very slow. Continuing anyway...")
+        # Check if the URL is still the same, maybe a redirect failed?
+        if driver.current_url != target_url:
+             print(f"{log_prefix} URL changed to: {driver.current_url}. Possible redirect issue.")
+             # Consider failing here if the initial load seems broken
+             # raise TimeoutException("Page failed to load initial body or redirected unexpectedly.")
+
+
+    # Add variable delay after load for scripts to potentially run
+    delay = random.uniform(3, 6)
+    print(f"{log_prefix} Adding post-navigation delay of {delay:.1f}s...")
+    time.sleep(delay)
+
+    # More realistic human scrolling
+    print(f"{log_prefix} Simulating natural scrolling behavior...")
+    try:
+        scroll_amount = random.randint(300, 600)
+        driver.execute_script(f"window.scrollBy(0, {scroll_amount});")
+        time.sleep(random.uniform(0.8, 1.5))
+
+        # Sometimes scroll back up slightly
+        if random.random() > 0.7:
+            driver.execute_script(f"window.scrollBy(0, -{random.randint(50, 150)});")
+            time.sleep(random.uniform(0.5, 1))
+    except Exception as scroll_err:
+         print(f"{log_prefix} Warning: Error during scrolling: {scroll_err}")
+
+
+def interact_with_player(driver, wait, log_prefix=""):
+    """Switches into the player iframe if there is one and clicks through play buttons/overlays."""
+    # ----- Handle iframes if present -----
+    # handle_iframes will switch context if successful
+    switched_to_iframe = handle_iframes(driver, wait, log_prefix)
+    if switched_to_iframe:
+        print(f"{log_prefix} Working within iframe content now")
+        # Re-initialize wait context for the iframe if needed, though usually not required
+        # wait = WebDriverWait(driver, 20)
     else:
-        print(f"{log_prefix} INFO: Explicit driver not found at '{driver_path_explicit}'. Letting undetected-chromedriver manage driver download/path.")
+         print(f"{log_prefix} Staying in main page content.")
+
+
+    # ----- Handle common overlay/play button patterns -----
+    # Reduced interaction attempts, often only one click is needed
+    interaction_attempts = 2
+    overlay_handled = False
+    for attempt in range(interaction_attempts):
+        print(f"{log_prefix} Looking for player elements (attempt {attempt+1}/{interaction_attempts})...")
+        if handle_common_overlay_patterns(driver, wait, log_prefix):
+            overlay_handled = True
+            print(f"{log_prefix} Successfully interacted with player element on attempt {attempt+1}")
+            # Wait a bit longer after successful interaction for network activity
+            print(f"{log_prefix} Waiting after interaction...")
+            time.sleep(random.uniform(6, 10)) # Increased wait
+            break # Exit loop once handled
+        elif attempt < interaction_attempts - 1: # Don't wait after the last attempt
+            print(f"{log_prefix} No interactable elements found yet, waiting before next attempt...")
+            time.sleep(random.uniform(2, 4))
+
 
+    if not overlay_handled:
+        print(f"{log_prefix} No standard player elements found/clicked after {interaction_attempts} attempts. Waiting for potential autoplay or delayed load...")
+        # Increased wait if no interaction occurred, maybe autoplay or scripts are slow
+        time.sleep(random.uniform(10, 15))
 
+
+# Page titles / markup served instead of content when a site challenges or bans us
+BLOCK_TITLE_MARKERS = ('just a moment', 'attention required', 'access denied', '403 forbidden',
+                       '429 too many requests', 'ddos-guard', 'checking your browser')
+BLOCK_SOURCE_MARKERS = ('cf-chl-widget', 'id="challenge-form"', 'cf-browser-verification')
+
+
+def detect_block_page(driver, log_prefix=""):
+    """Returns True if the current page looks like a challenge/ban page rather than the site."""
     try:
-        print(f"{log_prefix} Initializing seleniumwire undetected_chromedriver...")
-        # --- MODIFIED DRIVER INSTANTIATION ---
-        driver = SwUcChrome(   # Use the imported class from seleniumwire.undetected_chromedriver
-            options=options,
-            seleniumwire_options=sw_options,
-            driver_executable_path=driver_executable # Pass explicit path or None
-        )
-        # --- END MODIFIED DRIVER INSTANTIATION ---
-
-        print(f"{log_prefix} Driver initialized.")
-        # Set timeouts
-        driver.set_page_load_timeout(settings.SCRAPER_TIMEOUT_SECONDS)
-        driver.implicitly_wait(5) # Small implicit wait can sometimes help stabilize element finding
-        wait = WebDriverWait(driver, 20) # Slightly shorter explicit wait default
-
-        print(f"{log_prefix} Navigating to {target_url}...")
-        driver.get(target_url)
-
-        # Wait for page body tag to ensure basic page structure is loaded
-        try:
-            wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-            print(f"{log_prefix} Page loaded. Body tag found.")
-        except TimeoutException:
-            print(f"{log_prefix} Warning: Timed out waiting for body tag. Page might be malformed or very slow. Continuing anyway...")
-            # Check if the URL is still the same, maybe a redirect failed?
-            if driver.current_url != target_url:
-                 print(f"{log_prefix} URL changed to: {driver.current_url}. Possible redirect issue.")
-                 # Consider failing here if the initial load seems broken
-                 # raise TimeoutException("Page failed to load initial body or redirected unexpectedly.")
-
-
-        # Add variable delay after load for scripts to potentially run
-        delay = random.uniform(3, 6)
-        print(f"{log_prefix} Adding post-navigation delay of {delay:.1f}s...")
-        time.sleep(delay)
-
-        # More realistic human scrolling
-        print(f"{log_prefix} Simulating natural scrolling behavior...")
-        try:
-            scroll_amount = random.randint(300, 600)
-            driver.execute_script(f"window.scrollBy(0, {scroll_amount});")
-            time.sleep(random.uniform(0.8, 1.5))
-
-            # Sometimes scroll back up slightly
-            if random.random() > 0.7:
-                driver.execute_script(f"window.scrollBy(0, -{random.randint(50, 150)});")
-                time.sleep(random.uniform(0.5, 1))
-        except Exception as scroll_err:
-             print(f"{log_prefix} Warning: Error during scrolling: {scroll_err}")
-
-
-        # ----- Handle iframes if present -----
-        # handle_iframes will switch context if successful
-        switched_to_iframe = handle_iframes(driver, wait, log_prefix)
-        if switched_to_iframe:
-            print(f"{log_prefix} Working within iframe content now")
-            # Re-initialize wait context for the iframe if needed, though usually not required
-            # wait = WebDriverWait(driver, 20)
-        else:
-             print(f"{log_prefix} Staying in main page content.")
+        title = (driver.title or '').lower()
+        source_head = driver.page_source[:20000].lower()
+    except Exception:
+        return False
+    if any(marker in title for marker in BLOCK_TITLE_MARKERS) or any(marker in source_head for marker in BLOCK_SOURCE_MARKERS):
+        print(f"{log_prefix} WARNING: Page looks like a challenge/block page (title: '{driver.title}').")
+        return True
+    return False
+
 
+def current_frame_host(driver):
+    """Hostname of the document the driver is currently in (the embed host when inside a player iframe)."""
+    try:
+        return (driver.execute_script("return window.location.hostname;") or '').lower() or None
+    except Exception:
+        return None
 
-        # ----- Handle common overlay/play button patterns -----
-        # Reduced interaction attempts, often only one click is needed
-        interaction_attempts = 2
-        overlay_handled = False
-        for attempt in range(interaction_attempts):
-            print(f"{log_prefix} Looking for player elements (attempt {attempt+1}/{interaction_attempts})...")
-            if handle_common_overlay_patterns(driver, wait, log_prefix):
-                overlay_handled = True
-                print(f"{log_prefix} Successfully interacted with player element on attempt {attempt+1}")
-                # Wait a bit longer after successful interaction for network activity
-                print(f"{log_prefix} Waiting after interaction...")
-                time.sleep(random.uniform(6, 10)) # Increased wait
-                break # Exit loop once handled
-            elif attempt < interaction_attempts - 1: # Don't wait after the last attempt
-                print(f"{log_prefix} No interactable elements found yet, waiting before next attempt...")
-                time.sleep(random.uniform(2, 4))
 
+def select_m3u8(driver, capture, log_prefix="", exclude_urls=(), search_page_source=True):
+    """
+    Drains the capture backend, validates the candidates and returns the best M3U8 URL or None.
+    URLs in exclude_urls (e.g. already assigned to an earlier episode) are skipped.
+    """
+    m3u8_url = None
 
-        if not overlay_handled:
-            print(f"{log_prefix} No standard player elements found/clicked after {interaction_attempts} attempts. Waiting for potential autoplay or delayed load...")
-            # Increased wait if no interaction occurred, maybe autoplay or scripts are slow
-            time.sleep(random.uniform(10, 15))
+    # ----- Capture and filter for M3U8 URLs -----
+    print(f"{log_prefix} Scanning network requests for M3U8 content...")
 
+    m3u8_candidates = [c for c in capture.collect(driver, log_prefix) if c['url'] not in exclude_urls]
 
-        # ----- Capture and filter for M3U8 URLs -----
-        print(f"{log_prefix} Scanning network requests for M3U8 content...")
 
-        m3u8_candidates = []
-        try:
-            # --- MODIFIED REQUEST ACCESS ---
-            # Access the requests attribute from the selenium-wire driver object
-            captured_requests = driver.requests # Get the list of requests captured so far
-            # --- END MODIFIED REQUEST ACCESS ---
-            print(f"{log_prefix} Analyzing {len(captured_requests)} captured network requests...")
-
-            for request in captured_requests:
-                # Check if URL is valid and contains potential M3U8 indicators
-                if request and request.url and isinstance(request.url, str) and (
-                    ('.m3u8' in request.url.lower()) or
-                    ('/master.' in request.url.lower()) or
-                    ('/playlist.' in request.url.lower()) or
-                    ('/manifest(format=m3u8' in request.url.lower()) # Add specific formats if seen
-                   ):
-
-                    status_code = 'N/A'
-                    content_type = 'unknown'
-                    timestamp = time.time() # Default timestamp
-
-                    # Try to get response details safely
-                    if request.response:
-                        status_code = request.response.status_code
-                        content_type = request.response.headers.get('Content-Type', 'unknown')
-                        if hasattr(request.response, 'date') and request.response.date:
-                            timestamp = request.response.date
-
-                        # Log only potentially useful candidates (status 2xx or redirects 3xx maybe)
-                        if status_code and (200 <= status_code < 400):
-                             print(f"{log_prefix} Potential stream URL: {request.url}")
-                             print(f"{log_prefix} - Status: {status_code}, Content-Type: {content_type}")
-                             m3u8_candidates.append({
-                                'url': request.url,
-                                'content_type': content_type,
-                                'timestamp': timestamp,
-                             })
-                    # else:
-                        # Optionally log requests without responses if needed for debug
-                        # print(f"{log_prefix} Found potential M3U8 URL pattern but no response captured: {request.url}")
-
-            # Clear requests after processing
-            if hasattr(driver, 'requests'): # Check attribute exists before deleting
-                del driver.requests
-                print(f"{log_prefix} Cleared captured network requests ({len(captured_requests)} processed).")
-
-        except AttributeError:
-            print(f"{log_prefix} FATAL: driver object does not have 'requests' attribute. Check driver initialization (ensure seleniumwire.uc is used).")
-            # Re-raise immediately as this is a fundamental setup issue
-            raise
-        except Exception as req_err:
-            print(f"{log_prefix} Error processing network requests: {type(req_err).__name__} - {req_err}")
-
-
-        # --- Filtering and Validation ---
-        valid_candidates = []
-        print(f"{log_prefix} Found {len(m3u8_candidates)} potential M3U8 candidates from network traffic.")
-        for candidate in m3u8_candidates:
-            # Prioritize URLs explicitly ending in .m3u8
-            if '.m3u8' in candidate['url'].lower().split('?')[0]: # Check before query params
-                print(f"{log_prefix} Validating M3U8 content for: {candidate['url']}")
-                if is_valid_m3u8(candidate['url']):
-                    print(f"{log_prefix} ✓ Confirmed valid M3U8 content via request.")
+    # --- Filtering and Validation ---
+    valid_candidates = []
+    print(f"{log_prefix} Found {len(m3u8_candidates)} potential M3U8 candidates from network traffic.")
+    for candidate in m3u8_candidates:
+        # Prioritize URLs explicitly ending in .m3u8
+        if '.m3u8' in candidate['url'].lower().split('?')[0]: # Check before query params
+            if candidate.get('verified') is not None:
+                # Body was already checked from the browser's own copy (CDP backend)
+                if candidate['verified']:
+                    print(f"{log_prefix} ✓ Confirmed valid M3U8 content from captured response body.")
                     valid_candidates.append(candidate)
                 else:
-                    print(f"{log_prefix} ✗ Failed M3U8 content validation via request for: {candidate['url']}")
-            # Keep other potential manifests but maybe rank them lower if needed
-            # else:
-            #    valid_candidates.append(candidate) # Or handle non-.m3u8 manifests differently
-
-        # Select best candidate (prefer most recent valid .m3u8)
-        if valid_candidates:
-            # Sort by timestamp (newest first)
-            sorted_candidates = sorted(valid_candidates, key=lambda x: x.get('timestamp', 0), reverse=True)
-            # Prefer candidates that passed validation
-            best_candidate = next((c for c in sorted_candidates if '.m3u8' in c['url'].lower().split('?')[0]), None)
-            if best_candidate:
-                 m3u8_url = best_candidate['url']
-                 print(f"{log_prefix} ✓✓✓ Selected validated M3U8 URL: {m3u8_url}")
+                    print(f"{log_prefix} ✗ Captured response body is not M3U8 for: {candidate['url']}")
+                continue
+            print(f"{log_prefix} Validating M3U8 content for: {candidate['url']}")
+            if is_valid_m3u8(candidate['url']):
+                print(f"{log_prefix} ✓ Confirmed valid M3U8 content via request.")
+                valid_candidates.append(candidate)
             else:
-                 # Fallback to most recent if no validated .m3u8 found
-                 m3u8_url = sorted_candidates[0]['url']
-                 print(f"{log_prefix} ✓✓✓ Selected M3U8 URL (fallback, validation failed/skipped): {m3u8_url}")
-
+                print(f"{log_prefix} ✗ Failed M3U8 content validation via request for: {candidate['url']}")
+        # Keep other potential manifests but maybe rank them lower if needed
+        # else:
+        #    valid_candidates.append(candidate) # Or handle non-.m3u8 manifests differently
+
+    # Select best candidate (prefer most recent valid .m3u8)
+    if valid_candidates:
+        # Sort by timestamp (newest first)
+        sorted_candidates = sorted(valid_candidates, key=lambda x: x.get('timestamp', 0), reverse=True)
+        # Prefer candidates that passed validation
+        best_candidate = next((c for c in sorted_candidates if '.m3u8' in c['url'].lower().split('?')[0]), None)
+        if best_candidate:
+             m3u8_url = best_candidate['url']
+             print(f"{log_prefix} ✓✓✓ Selected validated M3U8 URL: {m3u8_url}")
         else:
-            print(f"{log_prefix} ✗ No valid/usable M3U8 candidates found in initial network traffic.")
-
-            # Fallback: Check page source if no network hits
-            if not m3u8_url:
-                 print(f"{log_prefix} Trying fallback: Searching page source for M3U8 URLs...")
-                 try:
-                     page_source = driver.page_source
-                     # Refined regex to avoid javascript variables, look for common patterns
-                     hls_matches = re.findall(r'[\'"](https?://[^\'"\s]+\.m3u8[^\'"\s]*)[\'"]', page_source, re.IGNORECASE)
-                     if hls_matches:
-                         print(f"{log_prefix} Found {len(hls_matches)} potential M3U8 URLs in page source.")
-                         # Deduplicate
-                         unique_matches = list(dict.fromkeys(hls_matches))
-                         for url in unique_matches:
-                             print(f"{log_prefix} Validating source URL: {url}")
-                             if is_valid_m3u8(url):
-                                 m3u8_url = url
-                                 print(f"{log_prefix} ✓ Selected valid M3U8 from page source: {m3u8_url}")
-                                 break # Take the first valid one found in source
-                         if not m3u8_url:
-                              print(f"{log_prefix} ✗ No validated M3U8 URLs found in page source.")
-                     else:
-                          print(f"{log_prefix} No M3U8 patterns found in page source.")
-                 except Exception as source_err:
-                      print(f"{log_prefix} Error getting/parsing page source: {source_err}")
+             # Fallback to most recent if no validated .m3u8 found
+             m3u8_url = sorted_candidates[0]['url']
+             print(f"{log_prefix} ✓✓✓ Selected M3U8 URL (fallback, validation failed/skipped): {m3u8_url}")
+
+    else:
+        print(f"{log_prefix} ✗ No valid/usable M3U8 candidates found in initial network traffic.")
+
+        # Fallback: Check page source if no network hits
+        if not m3u8_url and search_page_source:
+             print(f"{log_prefix} Trying fallback: Searching page source for M3U8 URLs...")
+             try:
+                 page_source = driver.page_source
+                 # Refined regex to avoid javascript variables, look for common patterns
+                 hls_matches = re.findall(r'[\'"](https?://[^\'"\s]+\.m3u8[^\'"\s]*)[\'"]', page_source, re.IGNORECASE)
+                 if hls_matches:
+                     print(f"{log_prefix} Found {len(hls_matches)} potential M3U8 URLs in page source.")
+                     # Deduplicate
+                     unique_matches = [url for url in dict.fromkeys(hls_matches) if url not in exclude_urls]
+                     for url in unique_matches:
+                         print(f"{log_prefix} Validating source URL: {url}")
+                         if is_valid_m3u8(url):
+                             m3u8_url = url
+                             print(f"{log_prefix} ✓ Selected valid M3U8 from page source: {m3u8_url}")
+                             break # Take the first valid one found in source
+                     if not m3u8_url:
+                          print(f"{log_prefix} ✗ No validated M3U8 URLs found in page source.")
+                 else:
+                      print(f"{log_prefix} No M3U8 patterns found in page source.")
+             except Exception as source_err:
+                  print(f"{log_prefix} Error getting/parsing page source: {source_err}")
+
+    return m3u8_url
+
 
+def quit_browser(driver, capture, log_prefix=""):
+    """Quits the driver (tolerating uc's noisy shutdown) and releases capture backend resources."""
+    if driver:
+        print(f"{log_prefix} Quitting WebDriver.")
+        # Graceful quit with checks
+        try:
+            driver.quit()
+        except (OSError, ImportError) as quit_err: # Catch potential errors during uc quit specifically
+             print(f"{log_prefix} Error during driver.quit() (expected with uc sometimes): {type(quit_err).__name__} - {quit_err}. Process might already be terminated.")
+        except Exception as E:
+             print(f"{log_prefix} Unexpected error during driver.quit(): {type(E).__name__} - {E}. Process might already be terminated.")
+    capture.cleanup(log_prefix)
+
+
+async def scrape_for_m3u8(target_url: str, job_id: str, proxy_config: dict | None = None,
+                          capture_backend: str | None = None, session_info: dict | None = None) -> str | None:
+    """
+    Enhanced scraper for M3U8 URLs from streaming sites using undetected_chromedriver,
+    with pluggable network capture (selenium-wire proxy or CDP), overlay handling,
+    iframe support, and content validation.
+    If session_info is given it is filled for the rate limiter with 'blocked' (challenge page
+    on the target page), 'embed_host' (player iframe host) and 'embed_blocked' (challenge page
+    inside the player iframe).
+    Returns the M3U8 URL string or None if not found.
+    """
+    log_prefix = f"[Scraper Job {job_id}]"
+    print(f"{log_prefix} Starting enhanced scrape for: {target_url}")
+    m3u8_url = None
+    driver = None # Initialize driver to None
+
+    capture = get_capture_backend(capture_backend)
+    print(f"{log_prefix} Using '{capture.name}' network capture backend.")
+
+    try:
+        driver, wait = start_browser(capture, proxy_config, log_prefix)
+        load_page(driver, wait, target_url, log_prefix)
+        if session_info is not None:
+            session_info['blocked'] = detect_block_page(driver, log_prefix)
+        interact_with_player(driver, wait, log_prefix)
+        if session_info is not None:
+            # Still inside the player iframe here, so this judges the embed host, not the site
+            session_info['embed_host'] = current_frame_host(driver)
+            session_info['embed_blocked'] = detect_block_page(driver, log_prefix)
+        m3u8_url = select_m3u8(driver, capture, log_prefix)
 
     # --- Refined Exception Handling ---
     except (TimeoutException, NoSuchElementException, StaleElementReferenceException, NoSuchWindowException) as e:
@@ -541,24 +553,16 @@ async def scrape_for_m3u8(target_url: str, job_id: str, proxy_config: dict | Non
         raise # Re-raise critical failure
     except Exception as e:
         # Catch AttributeErrors specifically if they relate to driver setup
-        if isinstance(e, AttributeError) and 'driver' in locals() and driver is None:
+        if isinstance(e, AttributeError) and driver is None:
              print(f"{log_prefix} CRITICAL: Driver object likely not initialized correctly. Error: {e}")
         else:
              print(f"{log_prefix} Unexpected general error during scraping: {type(e).__name__} - {e}")
         # Save screenshot if driver exists
-        if 'driver' in locals() and driver: save_debug_screenshot(driver, f"debug_general_error_{job_id}.png", log_prefix)
+        if driver: save_debug_screenshot(driver, f"debug_general_error_{job_id}.png", log_prefix)
         raise # Re-raise general exceptions
     # --- END Refined Exception Handling ---
     finally:
-        if 'driver' in locals() and driver:
-            print(f"{log_prefix} Quitting WebDriver.")
-            # Graceful quit with checks
-            try:
-                driver.quit()
-            except (OSError, ImportError) as quit_err: # Catch potential errors during uc quit specifically
-                 print(f"{log_prefix} Error during driver.quit() (expected with uc sometimes): {type(quit_err).__name__} - {quit_err}. Process might already be terminated.")
-            except Exception as E:
-                 print(f"{log_prefix} Unexpected error during driver.quit(): {type(E).__name__} - {E}. Process might already be terminated.")
+        quit_browser(driver, capture, log_prefix)
 
     # --- Modified Return Logic ---
     if not m3u8_url:
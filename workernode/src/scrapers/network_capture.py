@@ -0,0 +1,315 @@
+# src/scrapers/network_capture.py
+import os
+import json
+import base64
+import binascii
+import shutil
+import tempfile
+import time
+from collections import deque
+from urllib.parse import urlsplit, unquote
+
+import undetected_chromedriver as uc
+
+from src.config import settings
+
+# URL fragments that mark a request as a possible HLS manifest
+MANIFEST_URL_MARKERS = ('.m3u8', '/master.', '/playlist.', '/manifest(format=m3u8')
+# Content-Type fragments that mark a response as an HLS manifest
+MANIFEST_CONTENT_TYPES = ('mpegurl', 'x-mpegurl', 'vnd.apple.mpegurl')
+
+
+def is_manifest_url(url):
+    """Cheap URL check used to decide if a request is worth keeping."""
+    if not url or not isinstance(url, str):
+        return False
+    url_lower = url.lower()
+    return any(marker in url_lower for marker in MANIFEST_URL_MARKERS)
+
+
+def _proxy_parts(proxy_config):
+    """Splits the selenium-wire style proxy dict into (scheme, host, port, user, password)."""
+    if not proxy_config or 'proxy' not in proxy_config or 'https' not in proxy_config['proxy']:
+        return None
+    parsed = urlsplit(proxy_config['proxy']['https'])
+    if not parsed.hostname or not parsed.port:
+        return None
+    return (
+        parsed.scheme or 'http',
+        parsed.hostname,
+        parsed.port,
+        unquote(parsed.username) if parsed.username else None,
+        unquote(parsed.password) if parsed.password else None,
+    )
+
+
+class SeleniumWireCapture:
+    """
+    Original capture mode: all traffic goes through selenium-wire's MITM proxy
+    and every request is kept in memory until collect() drains it.
+    """
+    name = 'seleniumwire'
+
+    def start_driver(self, options, proxy_config, driver_executable, log_prefix=""):
+        # Imported here so the CDP mode never loads the proxy stack
+        from seleniumwire.undetected_chromedriver import Chrome as SwUcChrome
+
+        # Selenium Wire options dictionary
+        sw_options = {}
+        if proxy_config and 'proxy' in proxy_config and 'https' in proxy_config['proxy']:
+            # Ensure correct structure for selenium-wire options
+            sw_options = {'proxy': proxy_config['proxy']}
+            # Log only host/port if possible
+            proxy_host_port = proxy_config['proxy']['https'].split('@')[-1]
+            print(f"{log_prefix} Configuring proxy via Selenium Wire: {proxy_host_port}")
+            # Many streaming sites detect and block datacenter IPs
+            # Residential proxies are recommended for production use
+        elif proxy_config:
+            print(f"{log_prefix} WARNING: Proxy config provided but structure is incorrect or missing 'https' key.")
+
+        print(f"{log_prefix} Initializing seleniumwire undetected_chromedriver...")
+        return SwUcChrome(   # Use the imported class from seleniumwire.undetected_chromedriver
+            options=options,
+            seleniumwire_options=sw_options,
+            driver_executable_path=driver_executable # Pass explicit path or None
+        )
+
+    def collect(self, driver, log_prefix=""):
+        """Returns manifest candidates seen so far and clears selenium-wire's request store."""
+        m3u8_candidates = []
+        try:
+            # Access the requests attribute from the selenium-wire driver object
+            captured_requests = driver.requests # Get the list of requests captured so far
+            print(f"{log_prefix} Analyzing {len(captured_requests)} captured network requests...")
+
+            for request in captured_requests:
+                # Check if URL is valid and contains potential M3U8 indicators
+                if request and is_manifest_url(request.url):
+                    status_code = 'N/A'
+                    content_type = 'unknown'
+                    timestamp = time.time() # Default timestamp
+
+                    # Try to get response details safely
+                    if request.response:
+                        status_code = request.response.status_code
+                        content_type = request.response.headers.get('Content-Type', 'unknown')
+                        if hasattr(request.response, 'date') and request.response.date:
+                            timestamp = request.response.date
+
+                        # Log only potentially useful candidates (status 2xx or redirects 3xx maybe)
+                        if status_code and (200 <= status_code < 400):
+                             print(f"{log_prefix} Potential stream URL: {request.url}")
+                             print(f"{log_prefix} - Status: {status_code}, Content-Type: {content_type}")
+                             m3u8_candidates.append({
+                                'url': request.url,
+                                'content_type': content_type,
+                                'timestamp': timestamp,
+                             })
+
+            # Clear requests after processing
+            if hasattr(driver, 'requests'): # Check attribute exists before deleting
+                del driver.requests
+                print(f"{log_prefix} Cleared captured network requests ({len(captured_requests)} processed).")
+
+        except AttributeError:
+            print(f"{log_prefix} FATAL: driver object does not have 'requests' attribute. Check driver initialization (ensure seleniumwire.uc is used).")
+            # Re-raise immediately as this is a fundamental setup issue
+            raise
+        except Exception as req_err:
+            print(f"{log_prefix} Error processing network requests: {type(req_err).__name__} - {req_err}")
+
+        return m3u8_candidates
+
+    def reset(self, driver):
+        """Discards everything captured so far."""
+        del driver.requests
+
+    def cleanup(self, log_prefix=""):
+        pass
+
+
+class CdpCapture:
+    """
+    Chrome DevTools Protocol capture mode: no proxy in the middle. chromedriver records
+    Network.* events only (no Page/Timeline events) in its performance log, which is drained
+    synchronously in collect() and reset(), so nothing from before either call is missed or
+    leaks into the next episode. Only manifest-like responses are kept, in a bounded buffer.
+    """
+    name = 'cdp'
+
+    def __init__(self, buffer_size=None):
+        self.buffer_size = buffer_size or settings.CAPTURE_BUFFER_SIZE
+        self._responses = deque(maxlen=self.buffer_size)
+        self._temp_dirs = []
+
+    def _enable_network_log(self, options):
+        """Asks chromedriver to log Network.* events, and nothing else, for get_log('performance')."""
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+
+    def _drain(self, driver):
+        """Pulls every event chromedriver has logged so far and buffers the manifest-like responses."""
+        for entry in driver.get_log('performance'):
+            raw = entry.get('message', '')
+            # Cheap string check first so only responseReceived events are JSON-decoded
+            if '"Network.responseReceived"' not in raw:
+                continue
+            try:
+                message = json.loads(raw).get('message', {})
+            except ValueError:
+                continue
+            if message.get('method') != 'Network.responseReceived':
+                continue
+            params = message.get('params', {})
+            response = params.get('response', {})
+            url = response.get('url')
+            mime_type = (response.get('mimeType') or '').lower()
+            if not is_manifest_url(url) and not any(t in mime_type for t in MANIFEST_CONTENT_TYPES):
+                continue
+            self._responses.append({
+                'request_id': params.get('requestId'),
+                'url': url,
+                'status': response.get('status'),
+                'content_type': response.get('mimeType') or 'unknown',
+                'timestamp': entry.get('timestamp', time.time() * 1000) / 1000,
+            })
+
+    def _build_proxy_auth_extension(self, user, password):
+        """Writes a tiny MV3 extension that answers Chrome's proxy auth challenge."""
+        ext_dir = tempfile.mkdtemp(prefix='proxy_auth_ext_')
+        self._temp_dirs.append(ext_dir)
+        manifest = {
+            'name': 'Proxy Auth',
+            'version': '1.0',
+            'manifest_version': 3,
+            'permissions': ['webRequest', 'webRequestAuthProvider'],
+            'host_permissions': ['<all_urls>'],
+            'background': {'service_worker': 'background.js'},
+        }
+        background_js = (
+            "chrome.webRequest.onAuthRequired.addListener(\n"
+            "  (details) => details.isProxy\n"
+            f"    ? {{ authCredentials: {{ username: {json.dumps(user)}, password: {json.dumps(password)} }} }}\n"
+            "    : {},\n"
+            "  { urls: ['<all_urls>'] },\n"
+            "  ['blocking']\n"
+            ");\n"
+        )
+        with open(os.path.join(ext_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        with open(os.path.join(ext_dir, 'background.js'), 'w') as f:
+            f.write(background_js)
+        return ext_dir
+
+    def _apply_proxy(self, options, proxy_config, log_prefix=""):
+        """Routes Chrome through the upstream proxy using Chrome's own proxy settings."""
+        parts = _proxy_parts(proxy_config)
+        if not parts:
+            if proxy_config:
+                print(f"{log_prefix} WARNING: Proxy config provided but structure is incorrect or missing 'https' key.")
+            return
+        scheme, host, port, user, password = parts
+        options.add_argument(f'--proxy-server={scheme}://{host}:{port}')
+        no_proxy = proxy_config['proxy'].get('no_proxy')
+        if no_proxy:
+            options.add_argument(f"--proxy-bypass-list={no_proxy.replace(',', ';')}")
+        print(f"{log_prefix} Configuring proxy via Chrome: {host}:{port}")
+
+        if user and password:
+            ext_dir = self._build_proxy_auth_extension(user, password)
+            # Chrome only honours the last --load-extension, so merge with any already set (uBlock)
+            extensions = [ext_dir]
+            for arg in list(options.arguments):
+                if arg.startswith('--load-extension='):
+                    extensions.extend(arg.split('=', 1)[1].split(','))
+                    options.arguments.remove(arg)
+                elif arg.startswith('--disable-extensions-except='):
+                    options.arguments.remove(arg)
+            joined = ','.join(extensions)
+            options.add_argument(f'--load-extension={joined}')
+            options.add_argument(f'--disable-extensions-except={joined}')
+
+    def start_driver(self, options, proxy_config, driver_executable, log_prefix=""):
+        self._apply_proxy(options, proxy_config, log_prefix)
+        self._enable_network_log(options)
+
+        print(f"{log_prefix} Initializing undetected_chromedriver with CDP network capture...")
+        driver = uc.Chrome(
+            options=options,
+            driver_executable_path=driver_executable # Pass explicit path or None
+        )
+        driver.execute_cdp_cmd('Network.enable', {})
+        return driver
+
+    def _read_body(self, driver, request_id):
+        """Fetches a captured response body from Chrome, or None if it was evicted."""
+        if not request_id:
+            return None
+        try:
+            result = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+        except Exception:
+            return None
+        body = result.get('body')
+        if body and result.get('base64Encoded'):
+            # CDNs often serve manifests as application/octet-stream, which Chrome base64-encodes.
+            # The tag check only needs the first 1KB (1368 base64 chars, a multiple of 4).
+            try:
+                return base64.b64decode(body[:1368]).decode('utf-8', errors='ignore')
+            except (binascii.Error, ValueError):
+                return None
+        return body
+
+    def collect(self, driver, log_prefix=""):
+        """Returns manifest candidates seen so far and empties the buffer."""
+        try:
+            self._drain(driver)
+        except Exception as log_err:
+            print(f"{log_prefix} Error reading Chrome performance log: {type(log_err).__name__} - {log_err}")
+        responses = list(self._responses)
+        self._responses.clear()
+        print(f"{log_prefix} Analyzing {len(responses)} manifest-like responses from CDP buffer (max {self.buffer_size})...")
+
+        m3u8_candidates = []
+        for response in responses:
+            status_code = response.get('status')
+            if not status_code or not (200 <= status_code < 400):
+                continue
+            print(f"{log_prefix} Potential stream URL: {response['url']}")
+            print(f"{log_prefix} - Status: {status_code}, Content-Type: {response['content_type']}")
+            candidate = {
+                'url': response['url'],
+                'content_type': response['content_type'],
+                'timestamp': response['timestamp'],
+            }
+            # Check the body Chrome already downloaded instead of fetching the URL again
+            body = self._read_body(driver, response.get('request_id'))
+            if body is not None:
+                body_lower = body[:1024].lower()
+                candidate['verified'] = ('#extm3u' in body_lower and
+                                         ('#ext-x-stream-inf' in body_lower or '#extinf' in body_lower))
+            m3u8_candidates.append(candidate)
+        return m3u8_candidates
+
+    def reset(self, driver):
+        """Discards everything captured so far, including events chromedriver has not handed over yet."""
+        driver.get_log('performance')
+        self._responses.clear()
+
+    def cleanup(self, log_prefix=""):
+        for temp_dir in self._temp_dirs:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        self._temp_dirs = []
+
+
+CAPTURE_BACKENDS = {
+    SeleniumWireCapture.name: SeleniumWireCapture,
+    CdpCapture.name: CdpCapture,
+}
+
+
+def get_capture_backend(name=None):
+    """Returns a fresh capture backend instance; defaults to settings.CAPTURE_BACKEND."""
+    backend_name = (name or settings.CAPTURE_BACKEND).lower()
+    if backend_name not in CAPTURE_BACKENDS:
+        raise ValueError(f"Unknown capture backend '{backend_name}'. Expected one of: {', '.join(CAPTURE_BACKENDS)}")
+    return CAPTURE_BACKENDS[backend_name]()
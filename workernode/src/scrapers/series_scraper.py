@@ -0,0 +1,232 @@
+# src/scrapers/series_scraper.py
+import re
+import time
+import random
+
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import (
+    TimeoutException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+    NoSuchWindowException,
+    SessionNotCreatedException,
+    WebDriverException
+)
+
+from src.config import settings
+from src.scrapers.network_capture import get_capture_backend
+from src.scrapers.media_scraper import (
+    click_element_safely,
+    current_frame_host,
+    detect_block_page,
+    interact_with_player,
+    load_page,
+    quit_browser,
+    save_debug_screenshot,
+    select_m3u8,
+    start_browser,
+)
+
+# Season tabs/buttons, most specific first
+SEASON_PATTERNS = [
+    "[data-season]",
+    ".ss-item, .season-item",
+    "#seasons a, #seasons li, .seasons a, .seasons li",
+    "a[href*='season'], button[class*='season']",
+]
+
+# Episode links/buttons, most specific first
+EPISODE_PATTERNS = [
+    "[data-episode]",
+    ".ep-item, .episode-item",
+    "#episodes a, .episodes a, ul[class*='episode'] li a",
+    "a[href*='episode'], a[title*='Episode']",
+]
+
+# "Episode 5", "Ep. 5", or "S1E5"/"S01 E05" (a bare "e" only counts right after a season number)
+EPISODE_NUMBER_RE = re.compile(r'\b(?:episode|ep\.?)\s*0*(\d+)|\bs\d+\s*e0*(\d+)', re.IGNORECASE)
+SEASON_NUMBER_RE = re.compile(r'\b(?:season|s)\s*0*(\d+)', re.IGNORECASE)
+
+
+def _visible(elements):
+    visible = []
+    for element in elements:
+        try:
+            if element.is_displayed():
+                visible.append(element)
+        except StaleElementReferenceException:
+            continue
+    return visible
+
+
+def _number_from(element, attr, pattern):
+    """Reads a season/episode number from a data attribute, or from the element's text/title."""
+    value = element.get_attribute(attr) or element.get_attribute('data-number')
+    if value and value.strip().isdigit():
+        return int(value.strip())
+    text = ' '.join(filter(None, [element.text, element.get_attribute('title')]))
+    match = pattern.search(text)
+    if match:
+        return int(next(group for group in match.groups() if group))
+    stripped = (element.text or '').strip()
+    return int(stripped) if stripped.isdigit() else None
+
+
+def select_season(driver, season, log_prefix=""):
+    """Clicks the tab for the requested season. Returns True if one was clicked."""
+    for css in SEASON_PATTERNS:
+        for element in _visible(driver.find_elements(By.CSS_SELECTOR, css)):
+            try:
+                if _number_from(element, 'data-season', SEASON_NUMBER_RE) == season:
+                    print(f"{log_prefix} Selecting season {season} via '{css}'")
+                    if click_element_safely(driver, element, log_prefix):
+                        time.sleep(random.uniform(2, 3)) # Let the episode list re-render
+                        return True
+            except StaleElementReferenceException:
+                continue
+    print(f"{log_prefix} WARNING: Season {season} selector not found. Using the episode list as shown.")
+    return False
+
+
+def find_episodes(driver, log_prefix=""):
+    """
+    Returns (css, episodes) for the first selector pattern that matches visible episode entries.
+    Each episode is {'number', 'label', 'href', 'index'}; href is set only for real links,
+    in which case the episode is opened by navigation instead of a click.
+    """
+    for css in EPISODE_PATTERNS:
+        elements = _visible(driver.find_elements(By.CSS_SELECTOR, css))
+        if not elements:
+            continue
+        episodes = []
+        for index, element in enumerate(elements):
+            try:
+                href = element.get_attribute('href')
+                if not href or href.endswith('#') or href.startswith('javascript:'):
+                    href = None
+                number = _number_from(element, 'data-episode', EPISODE_NUMBER_RE)
+                episodes.append({
+                    'number': number if number is not None else index + 1,
+                    'label': (element.text or element.get_attribute('title') or '').strip(),
+                    'href': href,
+                    'index': index,
+                })
+            except StaleElementReferenceException:
+                continue
+        print(f"{log_prefix} Found {len(episodes)} episodes via '{css}'")
+        return css, episodes
+    print(f"{log_prefix} No episode selector found on the page.")
+    return None, []
+
+
+async def scrape_series_for_m3u8(target_url: str, job_id: str, proxy_config: dict | None = None,
+                                 season: int | None = None, episodes: list | None = None,
+                                 on_episode=None, before_episode=None, capture_backend: str | None = None,
+                                 session_info: dict | None = None) -> list:
+    """
+    Resolves every episode of a season in ONE browser session: the show page is loaded once,
+    then the site's episode selector is walked and each episode's manifest is captured in turn.
+    before_episode(number) is called before each episode is opened so callers can pace page
+    loads; if it returns False the walk stops there and the episodes so far are returned.
+    on_episode(result, total) is called as each episode finishes so callers can stream progress.
+    session_info, if given, is filled with 'blocked', 'embed_host' and 'embed_blocked' as in
+    scrape_for_m3u8; a block seen on any episode counts.
+    Returns the list of per-episode results:
+    {'episode': n, 'label': '...', 'status': 'success'|'not_found'|'error', 'm3u8_url': ... }
+    """
+    log_prefix = f"[Series Job {job_id}]"
+    print(f"{log_prefix} Starting series scrape for: {target_url} (season={season}, episodes={episodes or 'all'})")
+    results = []
+    driver = None
+
+    capture = get_capture_backend(capture_backend)
+    print(f"{log_prefix} Using '{capture.name}' network capture backend.")
+
+    try:
+        driver, wait = start_browser(capture, proxy_config, log_prefix)
+        load_page(driver, wait, target_url, log_prefix)
+        if session_info is not None:
+            session_info['blocked'] = detect_block_page(driver, log_prefix)
+        if season is not None:
+            select_season(driver, season, log_prefix)
+
+        css, found = find_episodes(driver, log_prefix)
+        if episodes:
+            wanted = set(episodes)
+            found = [ep for ep in found if ep['number'] in wanted]
+        if len(found) > settings.SERIES_MAX_EPISODES:
+            print(f"{log_prefix} Limiting to the first {settings.SERIES_MAX_EPISODES} of {len(found)} episodes.")
+            found = found[:settings.SERIES_MAX_EPISODES]
+
+        found_urls = set()
+        for episode in found:
+            ep_prefix = f"{log_prefix}[E{episode['number']}]"
+            if before_episode and not before_episode(episode['number']):
+                print(f"{ep_prefix} Stopping before this episode (rate limited); returning {len(results)} episodes.")
+                break
+            result = {'episode': episode['number'], 'label': episode['label'], 'status': 'not_found', 'm3u8_url': None}
+            try:
+                driver.switch_to.default_content()
+                capture.reset(driver) # Drop traffic from the previous episode
+
+                if episode['href']:
+                    load_page(driver, wait, episode['href'], ep_prefix)
+                    if session_info is not None and detect_block_page(driver, ep_prefix):
+                        session_info['blocked'] = True
+                else:
+                    elements = _visible(driver.find_elements(By.CSS_SELECTOR, css))
+                    if episode['index'] >= len(elements):
+                        # List was re-rendered (e.g. after an earlier navigation); reload the show page once
+                        load_page(driver, wait, target_url, ep_prefix)
+                        if season is not None:
+                            select_season(driver, season, ep_prefix)
+                        elements = _visible(driver.find_elements(By.CSS_SELECTOR, css))
+                    if episode['index'] >= len(elements) or not click_element_safely(driver, elements[episode['index']], ep_prefix):
+                        raise NoSuchElementException(f"Could not click episode {episode['number']}")
+                    time.sleep(random.uniform(3, 5)) # Let the player swap sources
+
+                interact_with_player(driver, wait, ep_prefix)
+                if session_info is not None:
+                    frame_host = current_frame_host(driver)
+                    if not session_info.get('embed_host'):
+                        session_info['embed_host'] = frame_host
+                    if frame_host == session_info['embed_host']:
+                        # Inside the player iframe: a challenge here is the embed host's, not the site's
+                        session_info['embed_blocked'] = (session_info.get('embed_blocked', False) or
+                                                         detect_block_page(driver, ep_prefix))
+                # Page source only belongs to this episode when we navigated to its own page
+                m3u8_url = select_m3u8(driver, capture, ep_prefix, exclude_urls=found_urls,
+                                       search_page_source=bool(episode['href']))
+                if m3u8_url:
+                    found_urls.add(m3u8_url)
+                    result.update(status='success', m3u8_url=m3u8_url)
+                    print(f"{ep_prefix} ✓ Episode resolved: {m3u8_url}")
+                else:
+                    print(f"{ep_prefix} ✗ No M3U8 found for this episode.")
+            except (NoSuchWindowException, SessionNotCreatedException):
+                raise # Browser is gone; nothing else in this session can succeed
+            except WebDriverException as e:
+                print(f"{ep_prefix} Episode failed: {type(e).__name__} - {e}")
+                result.update(status='error', error=type(e).__name__)
+
+            results.append(result)
+            if on_episode:
+                on_episode(result, len(found))
+
+    except (TimeoutException, NoSuchElementException, StaleElementReferenceException, NoSuchWindowException) as e:
+        print(f"{log_prefix} Selenium interaction error during series scrape: {type(e).__name__} - {e}")
+        if driver: save_debug_screenshot(driver, f"debug_series_selenium_error_{job_id}.png", log_prefix)
+        raise # Re-raise to indicate failure to Celery
+    except SessionNotCreatedException as e:
+        print(f"{log_prefix} CRITICAL: Failed to create browser session: {e}")
+        raise # Re-raise critical failure
+    except Exception as e:
+        print(f"{log_prefix} Unexpected general error during series scrape: {type(e).__name__} - {e}")
+        if driver: save_debug_screenshot(driver, f"debug_series_general_error_{job_id}.png", log_prefix)
+        raise # Re-raise general exceptions
+    finally:
+        quit_browser(driver, capture, log_prefix)
+
+    resolved = sum(1 for r in results if r['status'] == 'success')
+    print(f"{log_prefix} Series scrape finished: {resolved}/{len(results)} episodes resolved.")
+    return results
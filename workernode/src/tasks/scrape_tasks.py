@@ -1,12 +1,114 @@
 # src/tasks/scrape_tasks.py
 import logging
+import random
+import threading
+import time
+import redis
+from celery.exceptions import Ignore, SoftTimeLimitExceeded
 from src.celery_app import celery_app # Import the Celery app instance
 from src.config import settings      # Import configuration
 from src.scrapers.media_scraper import scrape_for_m3u8 # Import scraper function
+from src.scrapers.series_scraper import scrape_series_for_m3u8 # Season-wide scraper
+from src.rate_limiter import DomainRateLimiter, host_of # Cluster-wide per-domain limits
 import asyncio # Use asyncio for the async scraper function
 
 logger = logging.getLogger(__name__) # Get celery logger
 
+rate_limiter = DomainRateLimiter()
+
+
+def lease_seconds_for(task):
+    """
+    How long a job's concurrency slots are leased for: the task's time_limit, capped at
+    RATE_LIMIT_MAX_LEASE_SECONDS, plus RATE_LIMIT_LEASE_MARGIN_SECONDS. Jobs that run longer
+    keep their slots through keep_lease_alive, so a worker that is OOM-killed or restarted
+    only blocks the domain until the capped lease runs out.
+    """
+    return min(task.time_limit, settings.RATE_LIMIT_MAX_LEASE_SECONDS) + settings.RATE_LIMIT_LEASE_MARGIN_SECONDS
+
+
+def acquire_domain_slot(task, job_data, log_prefix):
+    """
+    Takes a token + concurrency slot for the job's target domain and known embed hosts,
+    leased for lease_seconds_for(task).
+    Returns the leased hosts ([] if limiting is off or Redis is unreachable), or None once
+    the job has used up RATE_LIMIT_MAX_DEFERRALS.
+    When a host is saturated the job is re-published under the same task id with a countdown
+    and Ignore is raised: the worker slot is freed at once for other domains, and the
+    deferral does not count against the task's retry budget.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return []
+    job_id = task.request.id
+    lease_seconds = lease_seconds_for(task)
+    try:
+        hosts = rate_limiter.hosts_for(job_data['targetUrl'])
+        granted, wait_seconds = rate_limiter.try_acquire(hosts, job_id, lease_seconds)
+    except redis.RedisError as exc:
+        logger.warning(f"{log_prefix} Rate limiter unavailable, proceeding without it: {exc}")
+        return []
+    if granted:
+        return hosts
+
+    deferrals = job_data.get('_deferrals', 0) + 1
+    if deferrals > settings.RATE_LIMIT_MAX_DEFERRALS:
+        logger.error(f"{log_prefix} Still rate limited after {deferrals - 1} deferrals on {hosts}. Giving up.")
+        return None
+    countdown = wait_seconds + random.uniform(0, 2) # Jitter so deferred jobs don't return in lockstep
+    logger.info(f"{log_prefix} Rate limited on {hosts}; deferring {countdown:.1f}s (deferral {deferrals}).")
+    task.apply_async(
+        args=[dict(job_data, _deferrals=deferrals)],
+        task_id=job_id,
+        countdown=countdown,
+        retries=task.request.retries,
+    )
+    task.update_state(state='DEFERRED', meta={'hosts': hosts, 'retry_in': countdown, 'deferrals': deferrals})
+    raise Ignore()
+
+
+def keep_lease_alive(hosts, job_id, lease_seconds, log_prefix):
+    """
+    Renews the job's slots every third of a lease from a daemon thread while the scrape runs.
+    Returns an Event; set it (before release_domain_slot) to stop renewing.
+    """
+    stop = threading.Event()
+    if not hosts:
+        return stop
+
+    def renew():
+        while not stop.wait(lease_seconds / 3):
+            try:
+                rate_limiter.renew(hosts, job_id, lease_seconds)
+            except redis.RedisError as exc:
+                logger.warning(f"{log_prefix} Could not renew rate limit lease: {exc}")
+
+    threading.Thread(target=renew, name=f"lease-{job_id}", daemon=True).start()
+    return stop
+
+
+def release_domain_slot(hosts, job_id, target_url, session_info, failed, log_prefix):
+    """
+    Frees the job's slots and feeds what the scrape saw back into the limiter.
+    Each host is judged only on its own page: the target domain on the main page, the embed
+    host on the player iframe. A scrape that raised (failed=True) can lower a rate on a block
+    it saw, but never counts as a clean visit that raises one.
+    """
+    if not hosts:
+        return
+    try:
+        rate_limiter.release(hosts, job_id)
+        domain = host_of(target_url)
+        if 'blocked' in session_info and (session_info['blocked'] or not failed): # Main page actually loaded
+            rate_limiter.record_outcome([domain], session_info['blocked'])
+        embed_host = session_info.get('embed_host')
+        if embed_host and embed_host != domain:
+            rate_limiter.record_embed_host(target_url, embed_host)
+            embed_blocked = session_info.get('embed_blocked', False)
+            if 'embed_blocked' in session_info and (embed_blocked or not failed):
+                rate_limiter.record_outcome([embed_host], embed_blocked)
+    except redis.RedisError as exc:
+        logger.warning(f"{log_prefix} Could not update rate limiter state: {exc}")
+
 
 # Define the Celery task
 # - bind=True gives access to 'self' (the task instance) for logging, retries etc.
@@ -42,6 +144,13 @@ def process_scrape_request(self, job_data: dict):
 
     logger.info(f"{log_prefix} Received job for {media_type} '{media_id}' - URL: {target_url}")
 
+    leased_hosts = acquire_domain_slot(self, job_data, log_prefix)
+    if leased_hosts is None:
+        return {'status': 'rate_limited', 'media_id': media_id, 'media_type': media_type}
+    session_info = {}
+    failed = False
+    lease_keeper = keep_lease_alive(leased_hosts, job_id, lease_seconds_for(self), log_prefix)
+
     try:
         # --- Proxy Setup (pass config if enabled) ---
         proxy_to_use = settings.PROXY_CONFIG if settings.PROXY_ENABLED else None
@@ -56,7 +165,7 @@ def process_scrape_request(self, job_data: dict):
         # If scrape_for_m3u8 is effectively sync (despite async def, only uses blocking selenium):
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        m3u8_url = loop.run_until_complete(scrape_for_m3u8(target_url, job_id, proxy_to_use))
+        m3u8_url = loop.run_until_complete(scrape_for_m3u8(target_url, job_id, proxy_to_use, session_info=session_info))
         loop.close()
 
 
@@ -76,8 +185,119 @@ def process_scrape_request(self, job_data: dict):
 
 
     except Exception as exc:
+        failed = True
         # Log the exception before Celery retries or marks as failed
         logger.error(f"{log_prefix} Scrape failed for {target_url}. Error: {exc}", exc_info=True)
         # If autoretry is configured, Celery handles raising Retry automatically
         # Otherwise, re-raise the exception to mark the task as failed after retries
-        raise exc
\ No newline at end of file
+        raise exc
+    finally:
+        lease_keeper.set()
+        release_domain_slot(leased_hosts, job_id, target_url, session_info, failed, log_prefix)
+
+
+@celery_app.task(
+    bind=True,
+    autoretry_for=(Exception,), # A browser crash mid-season retries the whole season
+    retry_kwargs={'max_retries': 1, 'countdown': 60},
+    track_started=True,
+    time_limit=settings.SERIES_TIMEOUT_SECONDS, # Covers every episode in one session
+    soft_time_limit=settings.SERIES_TIMEOUT_SECONDS - 10
+)
+def process_series_request(self, job_data: dict):
+    """
+    Celery task to resolve a whole season of a TV show in one browser session.
+    Expected job_data format:
+    {'targetUrl': '...', 'mediaId': '...', 'mediaType': 'tv', 'season': 1, 'episodes': [1, 2, ...]}
+    'season' and 'episodes' are optional (default: the season shown, all episodes).
+    Partial results are streamed as a PROGRESS state: {'episodes': [...so far], 'total': n}
+    Every episode page load takes its own rate limit token; if a token is more than
+    RATE_LIMIT_EPISODE_MAX_WAIT_SECONDS away the season stops there with status 'partial'.
+    """
+    target_url = job_data.get('targetUrl')
+    media_id = job_data.get('mediaId')
+    season = job_data.get('season')
+    episodes = job_data.get('episodes')
+    job_id = self.request.id
+
+    log_prefix = f"[Celery Series Task {job_id}]"
+
+    if not target_url:
+        logger.error(f"{log_prefix} Missing targetUrl in job_data: {job_data}")
+        raise ValueError("Job data must include 'targetUrl'.")
+
+    logger.info(f"{log_prefix} Received series job for '{media_id}' season {season} - URL: {target_url}")
+
+    leased_hosts = acquire_domain_slot(self, job_data, log_prefix)
+    if leased_hosts is None:
+        return {'status': 'rate_limited', 'media_id': media_id, 'media_type': 'tv', 'season': season, 'episodes': []}
+    session_info = {}
+    failed = False
+    lease_keeper = keep_lease_alive(leased_hosts, job_id, lease_seconds_for(self), log_prefix)
+    stopped_early = False
+
+    resolved_so_far = []
+
+    def take_episode_token(episode_number):
+        # The job's own token paid for the show page; each episode is another page load
+        nonlocal stopped_early
+        waited = 0
+        while True:
+            try:
+                granted, wait_seconds = rate_limiter.take_token(leased_hosts)
+            except redis.RedisError as exc:
+                logger.warning(f"{log_prefix} Rate limiter unavailable, proceeding without it: {exc}")
+                return True
+            if granted:
+                return True
+            if waited + wait_seconds > settings.RATE_LIMIT_EPISODE_MAX_WAIT_SECONDS:
+                logger.info(f"{log_prefix} Rate limited on {leased_hosts} before episode {episode_number}; stopping early.")
+                stopped_early = True
+                return False
+            time.sleep(wait_seconds) # Holds the browser, but only up to the bounded wait
+            waited += wait_seconds
+
+    def publish_progress(result, total):
+        # Stream each finished episode to the result backend as it happens
+        resolved_so_far.append(result)
+        self.update_state(state='PROGRESS', meta={
+            'media_id': media_id,
+            'season': season,
+            'episodes': resolved_so_far,
+            'total': total,
+        })
+
+    try:
+        proxy_to_use = settings.PROXY_CONFIG if settings.PROXY_ENABLED else None
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        results = loop.run_until_complete(scrape_series_for_m3u8(
+            target_url, job_id, proxy_to_use,
+            season=season, episodes=episodes, on_episode=publish_progress,
+            before_episode=take_episode_token if leased_hosts else None, session_info=session_info
+        ))
+        loop.close()
+
+        resolved = sum(1 for r in results if r['status'] == 'success')
+        logger.info(f"{log_prefix} Resolved {resolved}/{len(results)} episodes.")
+        if stopped_early:
+            status = 'partial' # Episodes were left unopened because of the rate limit, whatever resolved so far
+        else:
+            status = 'success' if resolved == len(results) and results else ('partial' if resolved else 'completed_no_url')
+        return {'status': status, 'media_id': media_id, 'media_type': 'tv', 'season': season, 'episodes': results}
+
+    except SoftTimeLimitExceeded:
+        failed = True
+        # Keep what was resolved before time ran out instead of discarding it. Returning here
+        # also keeps autoretry from replaying a season that would just run out of time again.
+        logger.warning(f"{log_prefix} Soft time limit hit after {len(resolved_so_far)} episodes; returning partial results.")
+        return {'status': 'partial', 'media_id': media_id, 'media_type': 'tv', 'season': season, 'episodes': resolved_so_far}
+
+    except Exception as exc:
+        failed = True
+        logger.error(f"{log_prefix} Series scrape failed for {target_url}. Error: {exc}", exc_info=True)
+        raise exc
+    finally:
+        lease_keeper.set()
+        release_domain_slot(leased_hosts, job_id, target_url, session_info, failed, log_prefix)
@@ -0,0 +1,102 @@
+# tests/test_autoscaler.py
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src import autoscaler
+from src.autoscaler import QueueDepthAutoscaler, read_local_backlog
+from src.config import settings
+
+
+class FakeRedis:
+    """Just enough of redis-py for read_queue_stats."""
+
+    def __init__(self, messages=()):
+        self.messages = list(messages)
+
+    def llen(self, name):
+        return len(self.messages)
+
+    def lindex(self, name, index):
+        return self.messages[index] if self.messages else None
+
+
+class FakeRequest:
+    """Stands in for celery.worker.request.Request (hashable by identity, like the real one)."""
+
+    def __init__(self, headers):
+        self.request_dict = headers
+
+
+def make_request(enqueued_at=None):
+    return FakeRequest({} if enqueued_at is None else {'enqueued_at': enqueued_at})
+
+
+@pytest.fixture
+def scaler(monkeypatch):
+    monkeypatch.setattr(settings, 'AUTOSCALE_TARGET_WAIT_SECONDS', 30.0)
+    monkeypatch.setattr(settings, 'AUTOSCALE_LOW_WATERMARK_RATIO', 0.25)
+    monkeypatch.setattr(settings, 'AUTOSCALE_SCALE_DOWN_DELAY_SECONDS', 120.0)
+    monkeypatch.setattr(settings, 'AUTOSCALE_MAX_CPU_PERCENT', 85.0)
+    monkeypatch.setattr(settings, 'AUTOSCALE_MIN_FREE_MEMORY_MB', 1024)
+    monkeypatch.setattr(settings, 'AUTOSCALE_MEMORY_PER_SLOT_MB', 600)
+    monkeypatch.setattr(autoscaler.psutil, 'cpu_percent', lambda interval=None: 10.0)
+    monkeypatch.setattr(autoscaler.psutil, 'virtual_memory', lambda: SimpleNamespace(available=8192 * 1024 * 1024))
+    instance = QueueDepthAutoscaler(pool=None, max_concurrency=4, min_concurrency=1)
+    instance._redis = FakeRedis()
+    return instance
+
+
+def test_read_local_backlog_skips_active_and_ages_oldest():
+    now = time.time()
+    running = make_request(now - 100)
+    waiting = [make_request(now - 40), make_request(now - 5), make_request()]
+    count, oldest_age = read_local_backlog(waiting + [running], {running}, now=now)
+    assert count == 3
+    assert oldest_age == pytest.approx(40)
+
+
+def test_read_local_backlog_without_stamps_has_no_age():
+    assert read_local_backlog([make_request()], set()) == (1, None)
+
+
+def test_scales_up_when_jobs_are_reserved_locally_but_redis_is_empty(scaler, monkeypatch):
+    now = time.time()
+    running = make_request(now - 50)
+    prefetched = [make_request(now - 45), make_request(now - 44), make_request(now - 43)]
+    monkeypatch.setattr(autoscaler.worker_state, 'reserved_requests', set(prefetched + [running]))
+    monkeypatch.setattr(autoscaler.worker_state, 'active_requests', {running})
+
+    metrics = scaler.read_metrics()
+    assert metrics['depth'] == 3
+    assert metrics['oldest_age'] == pytest.approx(45, abs=1)
+    assert scaler.desired_slots(metrics, procs=1, now=0.0) == 2
+
+
+def test_redis_backlog_still_counts_alongside_local(scaler, monkeypatch):
+    scaler._redis = FakeRedis([b'{"headers": {}}', b'{"headers": {}}'])
+    monkeypatch.setattr(autoscaler.worker_state, 'reserved_requests', {make_request()})
+    monkeypatch.setattr(autoscaler.worker_state, 'active_requests', set())
+
+    metrics = scaler.read_metrics()
+    assert metrics['depth'] == 3
+    assert metrics['oldest_age'] is None
+    assert scaler.desired_slots(metrics, procs=2, now=0.0) == 3
+
+
+def test_idle_node_scales_down_after_delay(scaler, monkeypatch):
+    monkeypatch.setattr(autoscaler.worker_state, 'reserved_requests', set())
+    monkeypatch.setattr(autoscaler.worker_state, 'active_requests', set())
+
+    metrics = scaler.read_metrics()
+    assert metrics['depth'] == 0
+    assert scaler.desired_slots(metrics, procs=3, now=0.0) == 3 # Starts the hysteresis timer
+    assert scaler.desired_slots(metrics, procs=3, now=60.0) == 3
+    assert scaler.desired_slots(metrics, procs=3, now=121.0) == 2
+
+
+def test_unstamped_jobs_within_capacity_count_as_calm(scaler):
+    metrics = {'depth': 2, 'oldest_age': None, 'cpu_percent': 10.0, 'free_memory_mb': 8192}
+    assert scaler.desired_slots(metrics, procs=3, now=0.0) == 3
+    assert scaler.desired_slots(metrics, procs=3, now=121.0) == 2
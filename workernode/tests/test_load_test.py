@@ -0,0 +1,44 @@
+# tests/test_load_test.py
+import pytest
+
+from load_test import TrackedJob, percentile, summarize
+
+
+def make_job(media_id, enqueued_at, finished_at, outcome='success'):
+    job = TrackedJob({'targetUrl': f'http://fixture/{media_id}', 'mediaId': media_id, 'mediaType': 'movie'})
+    job.enqueued_at = enqueued_at
+    job.finished_at = finished_at
+    job.outcome = outcome
+    return job
+
+
+@pytest.mark.parametrize('pct, expected', [(0, 1), (20, 1), (21, 2), (50, 3), (90, 5), (100, 5)])
+def test_percentile_is_nearest_rank(pct, expected):
+    assert percentile([1, 2, 3, 4, 5], pct) == expected
+
+
+def test_percentile_of_empty_list_is_none():
+    assert percentile([], 50) is None
+
+
+def test_percentile_p95_of_twenty_samples():
+    assert percentile(list(range(1, 21)), 95) == 19
+
+
+def test_summarize_counts_timeouts_in_latency():
+    jobs = [
+        make_job('a', 0.0, 10.0),
+        make_job('b', 0.0, 20.0),
+        make_job('a', 0.0, 30.0),
+        make_job('c', 0.0, 300.0, outcome='timeout'),
+    ]
+    report = summarize(jobs, start=0.0)
+    assert report['jobs'] == 4
+    assert report['unique_titles'] == 3
+    assert report['latency_timeouts'] == 1
+    assert report['latency_seconds']['max'] == 300.0
+    assert report['latency_seconds']['p99'] == 300.0
+    assert report['latency_seconds']['p50'] == 20.0
+    assert report['outcomes'] == {'success': 3, 'timeout': 1}
+    # Throughput only counts jobs that actually finished
+    assert report['throughput_jobs_per_minute'] == pytest.approx(3 / 300.0 * 60, abs=0.01)